@@ -1,22 +1,55 @@
+import argparse
 import csv
+import json
+import multiprocessing
+import os
 import sys
+import tempfile
 
-from util import Node, StackFrontier, QueueFrontier
+from graph import SNAPSHOT, Graph, load_graph, snapshot_key
+from landmarks import LANDMARKS, LandmarkIndex, load_landmarks
 
 # Maps names to a set of corresponding person_ids
 names = {}
 
-# Maps person_ids to a dictionary of: name, birth, movies (a set of movie_ids)
+# Maps person_ids to a dictionary of: name, birth, movies (a set of movie_ids),
+# component (the person_id representing their connected component)
 people = {}
 
 # Maps movie_ids to a dictionary of: title, year, stars (a set of person_ids)
 movies = {}
 
+# Maps each component's representative person_id to the people in it
+component_sizes = {}
 
-def load_data(directory):
+# Compact integer-indexed graph, used instead of the dictionaries above
+# when data is loaded with `compact=True`
+graph = None
+
+# Landmark distance index over `graph`, if loaded with `num_landmarks`
+landmarks = None
+
+
+def load_data(directory, compact=False, num_landmarks=0):
     """
     Load data from CSV files into memory.
+
+    If `compact` is true, load a `Graph` instead of the `names`, `people`
+    and `movies` dictionaries. The graph is memory-mapped from a snapshot
+    next to the CSV files, which is rebuilt whenever they change.
+
+    If `num_landmarks` is positive, also load (or build and save) a
+    landmark index over the compact graph, which lets searches reject
+    disconnected pairs at once and prune people who are too far from
+    the goal to lie on a shortest path.
     """
+    global graph, landmarks
+    if compact or num_landmarks:
+        graph = load_graph(directory)
+        if num_landmarks:
+            landmarks = load_landmarks(directory, graph, num_landmarks)
+        return
+
     # Load people
     with open(f"{directory}/people.csv", encoding="utf-8") as f:
         reader = csv.DictReader(f)
@@ -51,15 +84,135 @@ def load_data(directory):
             except KeyError:
                 pass
 
+    # Label connected components, so disconnected pairs are rejected at once
+    label_components()
+
+
+def label_components():
+    """
+    Store in `people` the component of each person, using union-find
+    over the stars of each movie, and count people per component.
+    """
+    parent = {person_id: person_id for person_id in people}
+
+    def find(person_id):
+        root = person_id
+        while parent[root] != root:
+            root = parent[root]
+        while parent[person_id] != root:
+            parent[person_id], person_id = root, parent[person_id]
+        return root
+
+    for movie in movies.values():
+        stars = [person_id for person_id in movie["stars"] if person_id in parent]
+        for person_id in stars[1:]:
+            first, other = find(stars[0]), find(person_id)
+            if first != other:
+                parent[other] = first
+
+    component_sizes.clear()
+    for person_id in people:
+        root = find(person_id)
+        people[person_id]["component"] = root
+        component_sizes[root] = component_sizes.get(root, 0) + 1
+
+
+def component_size(person_id):
+    """
+    Returns the number of people connected to a person, including them.
+    """
+    if graph is not None:
+        return graph.component_size(graph.person_index(person_id))
+    return component_sizes[people[person_id]["component"]]
+
+
+def distances_from(person_id):
+    """
+    Yields a (person_id, distance, parent) record for everyone connected
+    to a person, in order of distance, where parent is the person_id
+    they were first reached from (None for the person themselves).
+
+    Runs a single breadth-first search, one level at a time, expanding
+    each movie only once.
+    """
+    if graph is not None:
+        source = graph.person_index(person_id)
+        for distance, reached, parents in graph.levels(source):
+            for person, parent in zip(reached, parents):
+                yield (graph.person_id(person), distance,
+                       graph.person_id(parent) if distance else None)
+        return
+
+    yield person_id, 0, None
+    reached = {person_id}
+    seen_movies = set()
+    frontier = [person_id]
+    distance = 0
+    while frontier:
+        distance += 1
+        next_frontier = []
+        for parent in frontier:
+            for movie_id in people[parent]["movies"]:
+                if movie_id in seen_movies:
+                    continue
+                seen_movies.add(movie_id)
+                for neighbor in movies[movie_id]["stars"]:
+                    if neighbor not in reached:
+                        reached.add(neighbor)
+                        next_frontier.append(neighbor)
+                        yield neighbor, distance, parent
+        frontier = next_frontier
+
+
+def write_distances(person_id, f):
+    """
+    Write the records of `distances_from(person_id)` to file `f` as CSV
+    with columns person_id, distance, parent.
+    """
+    writer = csv.writer(f)
+    writer.writerow(["person_id", "distance", "parent"])
+    for record in distances_from(person_id):
+        writer.writerow(record)
+
 
 def main():
-    if len(sys.argv) > 2:
-        sys.exit("Usage: python degrees.py [directory]")
-    directory = sys.argv[1] if len(sys.argv) == 2 else "large"
+    parser = argparse.ArgumentParser(
+        usage="python degrees.py [--batch FILE [--processes N]] "
+              "[--distances PERSON] [--landmarks K] [directory]"
+    )
+    parser.add_argument("directory", nargs="?", default="large")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="answer source,target pairs from FILE (- for stdin)")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="number of worker processes in batch mode")
+    parser.add_argument("--distances", metavar="PERSON",
+                        help="write everyone's separation from PERSON as CSV")
+    parser.add_argument("--landmarks", type=int, default=0, metavar="K",
+                        help="build or load an index of K landmark people")
+    args = parser.parse_args()
+    directory = args.directory
+
+    if args.batch is not None:
+        if args.batch == "-":
+            batch(directory, sys.stdin, sys.stdout, args.processes,
+                  args.landmarks)
+        else:
+            with open(args.batch, encoding="utf-8") as f:
+                batch(directory, f, sys.stdout, args.processes,
+                      args.landmarks)
+        return
+
+    if args.distances is not None:
+        load_data(directory, compact=True)
+        person_id = resolve_person(args.distances)
+        if person_id is None:
+            sys.exit("Person not found.")
+        write_distances(person_id, sys.stdout)
+        return
 
     # Load data from files into memory
     print("Loading data...")
-    load_data(directory)
+    load_data(directory, compact=True, num_landmarks=args.landmarks)
     print("Data loaded.")
 
     source = person_id_for_name(input("Name: "))
@@ -69,21 +222,134 @@ def main():
     if target is None:
         sys.exit("Person not found.")
 
-    path = shortest_path(source, target)
+    path, num_explored = search(source, target)
+    print(f"{num_explored} people explored.")
 
     if path is None:
         print("Not connected.")
+        print(f"Their components have {component_size(source)} and "
+              f"{component_size(target)} people.")
     else:
         degrees = len(path)
         print(f"{degrees} degrees of separation.")
         path = [(None, source)] + path
         for i in range(degrees):
-            person1 = people[path[i][1]]["name"]
-            person2 = people[path[i + 1][1]]["name"]
-            movie = movies[path[i + 1][0]]["title"]
+            person1 = person_for_id(path[i][1])["name"]
+            person2 = person_for_id(path[i + 1][1])["name"]
+            movie = movie_for_id(path[i + 1][0])["title"]
             print(f"{i + 1}: {person1} and {person2} starred in {movie}")
 
 
+def batch(directory, pairs, output, processes=1, num_landmarks=0):
+    """
+    Answer every source,target pair in the CSV lines `pairs`, writing one
+    JSON object per pair to `output` in input order.
+
+    The data is loaded once. With more than one process, forked workers
+    inherit the loaded graph, and others memory-map the same snapshot,
+    so the pages are shared either way.
+    """
+    pairs = (row for row in csv.reader(pairs) if row)
+    load_data(directory, compact=True, num_landmarks=num_landmarks)
+    if processes > 1:
+        with tempfile.TemporaryDirectory() as scratch:
+            files = (None, None)
+            if multiprocessing.get_start_method() != "fork":
+                files = shared_files(directory, scratch, num_landmarks)
+            with multiprocessing.Pool(
+                processes, initializer=attach, initargs=files
+            ) as pool:
+                for result in pool.imap(answer, pairs, chunksize=16):
+                    output.write(json.dumps(result) + "\n")
+    else:
+        for row in pairs:
+            output.write(json.dumps(answer(row)) + "\n")
+    output.flush()
+
+
+def shared_files(directory, scratch, num_landmarks):
+    """
+    Returns the (snapshot, landmark index) files for workers to map: the
+    ones next to the CSV files if they are up to date, or else copies of
+    the loaded graph and index written to `scratch`, such as when the
+    data directory is read-only. The index file is None without landmarks.
+    """
+    key = snapshot_key(directory)
+    snapshot = os.path.join(directory, SNAPSHOT)
+    if not os.path.exists(snapshot) or Graph.load(snapshot, key) is None:
+        snapshot = os.path.join(scratch, SNAPSHOT)
+        graph.save(snapshot, key)
+
+    if landmarks is None:
+        return snapshot, None
+    index = os.path.join(directory, LANDMARKS)
+    index_key = {"data": key, "count": num_landmarks}
+    if (not os.path.exists(index)
+            or LandmarkIndex.load(index, index_key) is None):
+        index = os.path.join(scratch, LANDMARKS)
+        landmarks.save(index, index_key)
+    return snapshot, index
+
+
+def attach(snapshot, index):
+    """
+    Pool initializer: maps the graph and landmark index from the files
+    given by `shared_files`, unless the worker was forked with them
+    already loaded.
+    """
+    global graph, landmarks
+    if graph is None:
+        graph = Graph.load(snapshot)
+        if index is not None:
+            landmarks = LandmarkIndex.load(index)
+
+
+def answer(row):
+    """
+    Returns a JSON-ready result for a [source, target] row, where each of
+    source and target is either a person id or an unambiguous name.
+    """
+    if len(row) != 2:
+        return {"row": row, "error": "expected source,target"}
+    result = {"source": row[0].strip(), "target": row[1].strip()}
+    source = resolve_person(result["source"])
+    target = resolve_person(result["target"])
+    for person_id, field in [(source, "source"), (target, "target")]:
+        if person_id is None:
+            result["error"] = f"{field} not found or ambiguous"
+            return result
+
+    path, num_explored = search(source, target)
+    result["source_id"] = source
+    result["target_id"] = target
+    result["degrees"] = None if path is None else len(path)
+    result["path"] = path
+    result["explored"] = num_explored
+    if path is None:
+        result["component_sizes"] = [
+            component_size(source), component_size(target)
+        ]
+    return result
+
+
+def resolve_person(value):
+    """
+    Returns the person id for `value`, which may be an id or a name,
+    or None if it matches no one or more than one person.
+    """
+    if graph is not None:
+        if graph.person_index(value) is not None:
+            return value
+        person_ids = graph.people_named(value)
+    else:
+        if value in people:
+            return value
+        person_ids = list(names.get(value.lower(), set()))
+    if len(person_ids) == 1:
+        return person_ids[0]
+    return None
+
+
 def shortest_path(source, target):
     """
     Returns the shortest list of (movie_id, person_id) pairs
@@ -91,47 +357,157 @@ def shortest_path(source, target):
 
     If no possible path, returns None.
     """
+    path, num_explored = search(source, target)
+    return path
+
+
+def search(source, target):
+    """
+    Returns a (path, num_explored) tuple for the shortest path between
+    two people, running on the compact graph if one is loaded.
+    """
+    if graph is None:
+        if people[source]["component"] != people[target]["component"]:
+            return None, 0
+        return bidirectional_search(source, target, neighbors_for_person)
+
+    source, target = graph.person_index(source), graph.person_index(target)
+    if not graph.connected(source, target):
+        return None, 0
+    prune = None
+    if landmarks is not None:
+        prune = landmarks.pruner(source, target)
+        if prune is None:
+            return None, 0
+    path, num_explored = bidirectional_search(
+        source, target, graph.neighbors, prune
+    )
+    if path is not None:
+        path = [
+            (graph.movie_id(movie), graph.person_id(person))
+            for movie, person in path
+        ]
+    return path, num_explored
+
+
+def separation(source, target):
+    """
+    Returns the degrees of separation between two people, or None if
+    they are not connected.
+
+    With a landmark index loaded, disconnected pairs and pairs whose
+    landmark bounds agree are answered without searching.
+    """
+    if landmarks is not None:
+        bounds = landmarks.bounds(
+            graph.person_index(source), graph.person_index(target)
+        )
+        if bounds is None:
+            return None
+        lower, upper = bounds
+        if lower == upper:
+            return lower
+
+    path, num_explored = search(source, target)
+    return None if path is None else len(path)
+
+
+def bidirectional_search(source, target, neighbors, prune=None):
+    """
+    Bidirectional breadth-first search from `source` and `target` at once,
+    where `neighbors(state)` yields the (action, state) pairs next to a state.
+
+    Each round expands one full level of whichever side has the smaller
+    frontier, so the two searches meet in the middle and the first person
+    reached from both sides lies on a shortest path.
+
+    If given, `prune(state, depth, forward)` returns True for a state that
+    cannot lie on a shortest path when it is `depth` steps from the source
+    (or from the target, if `forward` is False); such states are never
+    expanded from that side.
+
+    Returns a (path, num_explored) tuple, where path is a list of
+    (action, state) pairs as in `shortest_path` and num_explored counts
+    the states expanded.
+    """
 
-    # TODO
     # Keep track of number of states explored
     num_explored = 0
 
-    # Initialize frontier to just the starting position
-    
-    start = Node(state=source, parent=None, action=None)
-    frontier = StackFrontier()
-    frontier.add(start)
+    if source == target:
+        return [], num_explored
 
-    # Initialize an empty explored set
-    explored = set()
+    # Map each reached state to the (action, state) it was reached from
+    forward = {source: None}
+    backward = {target: None}
+    forward_frontier = [source]
+    backward_frontier = [target]
+    forward_depth = backward_depth = 0
 
-    # Keep looping until solution found
-    while True:
+    # States each side has pruned
+    forward_pruned = set()
+    backward_pruned = set()
 
-        # If nothing left in frontier, then no path
-        if frontier.empty():
-            return None
-        
-        # Choose a node from the frontier
-        node = frontier.remove()
-        num_explored += 1
+    # Keep looping until the two searches meet
+    while forward_frontier and backward_frontier:
+
+        # Expand the side with less work to do
+        is_forward = len(forward_frontier) <= len(backward_frontier)
+        if is_forward:
+            frontier, parents, other = forward_frontier, forward, backward
+            forward_depth += 1
+            depth, pruned = forward_depth, forward_pruned
+        else:
+            frontier, parents, other = backward_frontier, backward, forward
+            backward_depth += 1
+            depth, pruned = backward_depth, backward_pruned
 
-        # If node is the goal, then we have a solution
-        if node.state == target:
-            both = []
-            while node.parent is not None:
-                both.append((node.action, node.state))
-                node = node.parent
-            both.reverse()
-            return both
+        next_frontier = []
+        for state in frontier:
+            num_explored += 1
+            for action, neighbor in neighbors(state):
+                if neighbor in parents or neighbor in pruned:
+                    continue
 
-        # Mark node as explored
-        explored.add(node.state)
+                # Both searches reached this state, so join the halves
+                if neighbor in other:
+                    parents[neighbor] = (action, state)
+                    return join_path(forward, backward, neighbor), num_explored
 
-        for action, state in neighbors_for_person(node.state):
-            if not frontier.contains_state(state) and state not in explored:
-                child = Node(state=state, parent=node, action=action)
-                frontier.add(child)
+                if prune is not None and prune(neighbor, depth, is_forward):
+                    pruned.add(neighbor)
+                    continue
+                parents[neighbor] = (action, state)
+                next_frontier.append(neighbor)
+
+        if frontier is forward_frontier:
+            forward_frontier = next_frontier
+        else:
+            backward_frontier = next_frontier
+
+    # If either frontier runs dry, then no path
+    return None, num_explored
+
+
+def join_path(forward, backward, meeting):
+    """
+    Returns the list of (action, state) pairs from the source of
+    `forward` to the target of `backward` through the `meeting` state.
+    """
+    path = []
+    state = meeting
+    while forward[state] is not None:
+        action, previous = forward[state]
+        path.append((action, state))
+        state = previous
+    path.reverse()
+
+    state = meeting
+    while backward[state] is not None:
+        action, following = backward[state]
+        path.append((action, following))
+        state = following
+    return path
 
 
 def person_id_for_name(name):
@@ -139,13 +515,16 @@ def person_id_for_name(name):
     Returns the IMDB id for a person's name,
     resolving ambiguities as needed.
     """
-    person_ids = list(names.get(name.lower(), set()))
+    if graph is None:
+        person_ids = list(names.get(name.lower(), set()))
+    else:
+        person_ids = graph.people_named(name)
     if len(person_ids) == 0:
         return None
     elif len(person_ids) > 1:
         print(f"Which '{name}'?")
         for person_id in person_ids:
-            person = people[person_id]
+            person = person_for_id(person_id)
             name = person["name"]
             birth = person["birth"]
             print(f"ID: {person_id}, Name: {name}, Birth: {birth}")
@@ -165,6 +544,12 @@ def neighbors_for_person(person_id):
     Returns (movie_id, person_id) pairs for people
     who starred with a given person.
     """
+    if graph is not None:
+        return {
+            (graph.movie_id(movie), graph.person_id(person))
+            for movie, person in graph.neighbors(graph.person_index(person_id))
+        }
+
     movie_ids = people[person_id]["movies"]
     neighbors = set()
     for movie_id in movie_ids:
@@ -173,5 +558,23 @@ def neighbors_for_person(person_id):
     return neighbors
 
 
+def person_for_id(person_id):
+    """
+    Returns the name, birth and movies of a person.
+    """
+    if graph is not None:
+        return graph.person(person_id)
+    return people[person_id]
+
+
+def movie_for_id(movie_id):
+    """
+    Returns the title, year and stars of a movie.
+    """
+    if graph is not None:
+        return graph.movie(movie_id)
+    return movies[movie_id]
+
+
 if __name__ == "__main__":
     main()
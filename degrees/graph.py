@@ -0,0 +1,550 @@
+import csv
+import json
+import mmap
+import os
+import sys
+from array import array
+from bisect import bisect_left
+
+# NumPy is optional: with it, breadth-first search expands each level
+# with whole-array operations instead of a loop per person and movie
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Binary snapshot of a graph, written next to the CSV files it came from
+SNAPSHOT = "degrees.snapshot"
+SNAPSHOT_VERSION = 3
+MAGIC = b"DEGREES\x01"
+
+# Arrays and string tables that make up a graph, in snapshot order
+ARRAYS = ["name_order",
+          "person_offsets", "person_movies", "movie_offsets", "movie_people",
+          "components", "component_sizes"]
+TABLES = ["person_ids", "names", "births", "movie_ids", "titles", "years"]
+
+
+class StringTable():
+    """
+    Read-only list of strings stored as one UTF-8 buffer plus an array
+    of offsets, so that a million names cost a million bytes-ish rather
+    than a million Python objects.
+    """
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, strings):
+        data = bytearray()
+        offsets = array("q", [0])
+        for string in strings:
+            data += string.encode("utf-8")
+            offsets.append(len(data))
+        return cls(bytes(data), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return str(self.data[self.offsets[i]:self.offsets[i + 1]], "utf-8")
+
+
+class Graph():
+    """
+    Compact representation of the people, movies and stars data.
+
+    People and movies are interned to consecutive integers in order of
+    their IMDb ids, compared as strings and kept as written, and the bipartite star graph is stored in
+    compressed sparse row form: the movies of person `p` are
+    `person_movies[person_offsets[p]:person_offsets[p + 1]]`, and the
+    stars of movie `m` are `movie_people[movie_offsets[m]:movie_offsets[m + 1]]`.
+
+    `components[p]` labels the connected component of person `p`, and
+    `component_sizes[c]` counts the people in component `c`.
+    """
+
+    def __init__(self, person_ids, names, births, name_order,
+                 movie_ids, titles, years,
+                 person_offsets, person_movies, movie_offsets, movie_people,
+                 components, component_sizes):
+        self.person_ids = person_ids
+        self.names = names
+        self.births = births
+        self.name_order = name_order
+        self.movie_ids = movie_ids
+        self.titles = titles
+        self.years = years
+        self.person_offsets = person_offsets
+        self.person_movies = person_movies
+        self.movie_offsets = movie_offsets
+        self.movie_people = movie_people
+        self.components = components
+        self.component_sizes = component_sizes
+
+    @classmethod
+    def from_csv(cls, directory):
+        """
+        Build a graph from the people.csv, movies.csv and stars.csv files
+        in `directory`.
+        """
+        with open(f"{directory}/people.csv", encoding="utf-8") as f:
+            people = sorted(
+                (row["id"], row["name"], row["birth"])
+                for row in csv.DictReader(f)
+            )
+        person_ids = StringTable.from_strings(person[0] for person in people)
+        names = StringTable.from_strings(person[1] for person in people)
+        births = StringTable.from_strings(person[2] for person in people)
+        name_order = array("i", sorted(
+            range(len(people)), key=lambda p: people[p][1].lower()
+        ))
+        del people
+
+        with open(f"{directory}/movies.csv", encoding="utf-8") as f:
+            movies = sorted(
+                (row["id"], row["title"], row["year"])
+                for row in csv.DictReader(f)
+            )
+        movie_ids = StringTable.from_strings(movie[0] for movie in movies)
+        titles = StringTable.from_strings(movie[1] for movie in movies)
+        years = StringTable.from_strings(movie[2] for movie in movies)
+        del movies
+
+        # Collect stars as parallel arrays, skipping unknown ids
+        star_people = array("i")
+        star_movies = array("i")
+        with open(f"{directory}/stars.csv", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                person = find(person_ids, row["person_id"])
+                movie = find(movie_ids, row["movie_id"])
+                if person is not None and movie is not None:
+                    star_people.append(person)
+                    star_movies.append(movie)
+
+        person_offsets, person_movies = compress(
+            star_people, star_movies, len(person_ids)
+        )
+        movie_offsets, movie_people = compress(
+            star_movies, star_people, len(movie_ids)
+        )
+        components, component_sizes = label_components(
+            len(person_ids), movie_offsets, movie_people
+        )
+        return cls(person_ids, names, births, name_order,
+                   movie_ids, titles, years,
+                   person_offsets, person_movies, movie_offsets, movie_people,
+                   components, component_sizes)
+
+    def save(self, filename, key):
+        """
+        Write the graph to a binary snapshot, tagged with `key`.
+        """
+        sections = {name: getattr(self, name) for name in ARRAYS}
+        for name in TABLES:
+            table = getattr(self, name)
+            sections[f"{name}.data"] = table.data
+            sections[f"{name}.offsets"] = table.offsets
+        write_arrays(filename, key, sections)
+
+    @classmethod
+    def load(cls, filename, key=None):
+        """
+        Memory-map a snapshot written by `Graph.save`.
+
+        Returns None if the file is not a snapshot or, when `key` is
+        given, if it was saved with a different key.
+        """
+        sections = read_arrays(filename, key)
+        if sections is None:
+            return None
+        fields = {name: sections[name] for name in ARRAYS}
+        for name in TABLES:
+            fields[name] = StringTable(
+                sections[f"{name}.data"], sections[f"{name}.offsets"]
+            )
+        return cls(**fields)
+
+    def connected(self, a, b):
+        """
+        Returns whether people `a` and `b` are in the same component.
+        """
+        return self.components[a] == self.components[b]
+
+    def component_size(self, person):
+        """
+        Returns the number of people in the component of `person`.
+        """
+        return self.component_sizes[self.components[person]]
+
+    def distances(self, source):
+        """
+        Returns an array with the degrees of separation from person
+        `source` to every person, or -1 for people who are not connected.
+        """
+        distance = array("i", [-1]) * len(self.person_ids)
+        if np is not None:
+            view = np.asarray(memoryview(distance))
+            for level, people, parents in self.levels(source):
+                view[np.asarray(memoryview(people))] = level
+            return distance
+        for level, people, parents in self.levels(source):
+            for person in people:
+                distance[person] = level
+        return distance
+
+    def levels(self, source):
+        """
+        Breadth-first search from person `source`, one level at a time.
+
+        Yields a (distance, people, parents) tuple per level, where `people`
+        is an array of everyone first reached at that distance and
+        `parents[i]` is the person that `people[i]` was reached from
+        (the source is its own parent).
+
+        Each movie is expanded once, by the first frontier person in it,
+        so a level costs the size of its movies' star lists rather than
+        one neighbor set per person.
+
+        With NumPy, each level is expanded at once by `vector_levels`;
+        without it, one person, movie and star at a time.
+        """
+        if np is not None:
+            yield from self.vector_levels(source)
+            return
+
+        reached = bytearray(len(self.person_ids))
+        seen_movies = bytearray(len(self.movie_ids))
+        reached[source] = 1
+        frontier = array("i", [source])
+        parents = array("i", [source])
+        distance = 0
+        while frontier:
+            yield distance, frontier, parents
+            distance += 1
+            next_frontier = array("i")
+            next_parents = array("i")
+            for person in frontier:
+                for movie in self.movies_for(person):
+                    if seen_movies[movie]:
+                        continue
+                    seen_movies[movie] = 1
+                    for neighbor in self.stars_for(movie):
+                        if not reached[neighbor]:
+                            reached[neighbor] = 1
+                            next_frontier.append(neighbor)
+                            next_parents.append(person)
+            frontier, parents = next_frontier, next_parents
+
+    def vector_levels(self, source):
+        """
+        `levels` with NumPy: gathers the movies of the whole frontier from
+        the compressed sparse rows at once, keeps the first frontier
+        person in each movie not yet expanded, then gathers the stars of
+        those movies and keeps the first appearance of each person not
+        yet reached. The results, order included, match the scalar loop.
+        """
+        person_offsets = np.asarray(memoryview(self.person_offsets))
+        person_movies = np.asarray(memoryview(self.person_movies))
+        movie_offsets = np.asarray(memoryview(self.movie_offsets))
+        movie_people = np.asarray(memoryview(self.movie_people))
+
+        reached = np.zeros(len(self.person_ids), dtype=bool)
+        seen_movies = np.zeros(len(self.movie_ids), dtype=bool)
+        reached[source] = True
+        frontier = np.array([source])
+        parents = frontier
+        distance = 0
+        while len(frontier):
+            yield (distance, array("i", frontier.astype(np.int32).tobytes()),
+                   array("i", parents.astype(np.int32).tobytes()))
+            distance += 1
+
+            movies, rows = gather(person_offsets, person_movies, frontier)
+            movies, starters = first_new(movies, frontier[rows], seen_movies)
+            people, rows = gather(movie_offsets, movie_people, movies)
+            frontier, parents = first_new(people, starters[rows], reached)
+
+    def person_index(self, person_id):
+        """
+        Returns the integer index of an IMDb person id, or None.
+        """
+        return find(self.person_ids, person_id)
+
+    def movie_index(self, movie_id):
+        """
+        Returns the integer index of an IMDb movie id, or None.
+        """
+        return find(self.movie_ids, movie_id)
+
+    def person_id(self, person):
+        return self.person_ids[person]
+
+    def movie_id(self, movie):
+        return self.movie_ids[movie]
+
+    def people_named(self, name):
+        """
+        Returns the IMDb ids of everyone called `name`, ignoring case.
+        """
+        name = name.lower()
+        order = self.name_order
+        i = bisect_left(order, name, key=lambda p: self.names[p].lower())
+        person_ids = []
+        while i < len(order) and self.names[order[i]].lower() == name:
+            person_ids.append(self.person_id(order[i]))
+            i += 1
+        return person_ids
+
+    def movies_for(self, person):
+        return self.person_movies[
+            self.person_offsets[person]:self.person_offsets[person + 1]
+        ]
+
+    def stars_for(self, movie):
+        return self.movie_people[
+            self.movie_offsets[movie]:self.movie_offsets[movie + 1]
+        ]
+
+    def neighbors(self, person):
+        """
+        Yields (movie, person) index pairs for people who starred
+        with a given person.
+        """
+        for movie in self.movies_for(person):
+            for neighbor in self.stars_for(movie):
+                yield movie, neighbor
+
+    def person(self, person_id):
+        """
+        Returns a person in the same shape as the `people` dictionary.
+        """
+        person = self.person_index(person_id)
+        if person is None:
+            raise KeyError(person_id)
+        return {
+            "name": self.names[person],
+            "birth": self.births[person],
+            "movies": {self.movie_id(movie) for movie in self.movies_for(person)}
+        }
+
+    def movie(self, movie_id):
+        """
+        Returns a movie in the same shape as the `movies` dictionary.
+        """
+        movie = self.movie_index(movie_id)
+        if movie is None:
+            raise KeyError(movie_id)
+        return {
+            "title": self.titles[movie],
+            "year": self.years[movie],
+            "stars": {self.person_id(person) for person in self.stars_for(movie)}
+        }
+
+
+def gather(offsets, values, rows):
+    """
+    Returns the compressed sparse rows `rows` of `values` concatenated,
+    along with, for each entry, its row's position in `rows`.
+    """
+    starts = offsets[rows]
+    counts = offsets[rows + 1] - starts
+    positions = np.repeat(np.arange(len(rows)), counts)
+    ends = np.cumsum(counts)
+    indices = np.arange(ends[-1] if len(ends) else 0) + np.repeat(
+        starts - (ends - counts), counts
+    )
+    return values[indices], positions
+
+
+def first_new(items, tags, seen):
+    """
+    Returns the items not yet marked in the boolean array `seen`, each
+    once at its first appearance, with their tags, and marks them.
+    """
+    new = ~seen[items]
+    items = items[new]
+    tags = tags[new]
+    first = np.unique(items, return_index=True)[1]
+    first.sort()
+    items = items[first]
+    seen[items] = True
+    return items, tags[first]
+
+
+def load_graph(directory):
+    """
+    Returns the graph for the CSV files in `directory`, loading it from
+    a snapshot if one is up to date, or building it and writing a new
+    snapshot otherwise.
+    """
+    filename = os.path.join(directory, SNAPSHOT)
+    key = snapshot_key(directory)
+    if os.path.exists(filename):
+        graph = Graph.load(filename, key)
+        if graph is not None:
+            return graph
+
+    graph = Graph.from_csv(directory)
+    try:
+        graph.save(filename, key)
+    except OSError:
+        # A read-only data directory just means no snapshot
+        pass
+    return graph
+
+
+def snapshot_key(directory):
+    """
+    Returns what a snapshot of `directory` must match to be reused:
+    the size and modification time of each CSV file.
+    """
+    key = {"version": SNAPSHOT_VERSION, "byteorder": sys.byteorder}
+    for name in ["people.csv", "movies.csv", "stars.csv"]:
+        stat = os.stat(os.path.join(directory, name))
+        key[name] = [stat.st_size, stat.st_mtime_ns]
+    return key
+
+
+def label_components(n, movie_offsets, movie_people):
+    """
+    Returns (components, sizes) arrays labelling the connected components
+    of `n` people, where two people are connected if they share a movie.
+
+    Uses union-find: the stars of each movie are merged into one set.
+    """
+    parent = array("i", range(n))
+
+    def find(person):
+        root = person
+        while parent[root] != root:
+            root = parent[root]
+
+        # Point everyone on the way straight at the root
+        while parent[person] != root:
+            parent[person], person = root, parent[person]
+        return root
+
+    for movie in range(len(movie_offsets) - 1):
+        stars = movie_people[movie_offsets[movie]:movie_offsets[movie + 1]]
+        if len(stars) < 2:
+            continue
+        root = find(stars[0])
+        for star in stars[1:]:
+            other = find(star)
+            if other != root:
+                parent[other] = root
+
+    # Number components in order of their first person
+    components = array("i", [-1]) * n
+    sizes = array("q")
+    for person in range(n):
+        root = find(person)
+        if components[root] < 0:
+            components[root] = len(sizes)
+            sizes.append(0)
+        components[person] = components[root]
+        sizes[components[person]] += 1
+    return components, sizes
+
+
+def write_arrays(filename, key, sections):
+    """
+    Write a dictionary of named arrays to a binary file tagged with `key`.
+
+    The file is a JSON header describing where each array starts,
+    followed by the raw arrays, each aligned to 8 bytes so that
+    `read_arrays` can map them straight into memory.
+    """
+    views = [(name, memoryview(array)) for name, array in sections.items()]
+
+    # Lay out sections after the header, then fix the header size
+    header = {"key": key, "sections": {}}
+    start = 4096
+    while True:
+        offset = start
+        for name, view in views:
+            header["sections"][name] = [offset, view.nbytes, view.format]
+            offset += align(view.nbytes)
+        encoded = json.dumps(header).encode("utf-8")
+        if len(MAGIC) + 8 + len(encoded) <= start:
+            break
+        start = align(len(MAGIC) + 8 + len(encoded))
+
+    # Write to a temporary file so readers never see a partial file
+    temporary = f"{filename}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(MAGIC)
+        f.write(len(encoded).to_bytes(8, "little"))
+        f.write(encoded)
+        for name, view in views:
+            f.seek(header["sections"][name][0])
+            f.write(view.cast("B"))
+        f.truncate(offset)
+    os.replace(temporary, filename)
+
+
+def read_arrays(filename, key=None):
+    """
+    Memory-map a file written by `write_arrays` and return its arrays
+    as a dictionary of memoryviews.
+
+    Returns None if the file is not in that format or, when `key` is
+    given, if it was written with a different key.
+    """
+    with open(filename, "rb") as f:
+        try:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return None
+    view = memoryview(buffer)
+    if bytes(view[:len(MAGIC)]) != MAGIC:
+        return None
+    length = int.from_bytes(view[len(MAGIC):len(MAGIC) + 8], "little")
+    start = len(MAGIC) + 8
+    header = json.loads(bytes(view[start:start + length]))
+    if key is not None and header["key"] != key:
+        return None
+
+    sections = {}
+    for name, (offset, nbytes, fmt) in header["sections"].items():
+        sections[name] = view[offset:offset + nbytes].cast(fmt)
+    return sections
+
+
+def align(n):
+    """
+    Rounds `n` up to a multiple of 8.
+    """
+    return (n + 7) // 8 * 8
+
+
+def find(ids, value):
+    """
+    Returns the position of IMDb id `value` in sorted table `ids`, or None.
+    """
+    i = bisect_left(ids, value)
+    if i < len(ids) and ids[i] == value:
+        return i
+    return None
+
+
+def compress(rows, columns, n):
+    """
+    Returns (offsets, values) arrays holding the edges `rows[i] -> columns[i]`
+    of a graph with `n` row vertices in compressed sparse row form.
+    """
+    offsets = array("q", bytes(8 * (n + 1)))
+    for row in rows:
+        offsets[row + 1] += 1
+    for i in range(n):
+        offsets[i + 1] += offsets[i]
+
+    position = array("q", offsets)
+    values = array("i", bytes(4 * len(rows)))
+    for row, column in zip(rows, columns):
+        values[position[row]] = column
+        position[row] += 1
+    return offsets, values
@@ -0,0 +1,157 @@
+import os
+from array import array
+
+from graph import read_arrays, snapshot_key, write_arrays
+
+# Landmark index, written next to the CSV files and the graph snapshot
+LANDMARKS = "degrees.landmarks"
+
+
+class LandmarkIndex():
+    """
+    Degrees of separation from a handful of landmark people to everyone.
+
+    For any landmark L, the triangle inequality gives
+    |d(L, a) - d(L, b)| <= d(a, b) <= d(a, L) + d(L, b),
+    so the index bounds the separation of any pair without searching,
+    and the lower bound is an admissible estimate of how far a person
+    in a search still is from its goal.
+    """
+
+    def __init__(self, landmarks, distances):
+        self.landmarks = landmarks
+
+        # distances[i * size + p] is the separation of landmark i and person p
+        self.distances = distances
+        self.size = len(distances) // len(landmarks) if len(landmarks) else 0
+
+    @classmethod
+    def build(cls, graph, count=8):
+        """
+        Pick up to `count` landmarks among the people with the most movies,
+        skipping anyone who co-starred with a landmark already picked,
+        and run a breadth-first search from each of them.
+        """
+        size = len(graph.person_ids)
+        offsets = graph.person_offsets
+        by_movies = sorted(
+            range(size), key=lambda p: offsets[p + 1] - offsets[p], reverse=True
+        )
+
+        landmarks = array("i")
+        distances = array("h")
+        for person in by_movies:
+            if len(landmarks) == count:
+                break
+            if offsets[person + 1] == offsets[person]:
+                break
+            if any(distances[i * size + person] == 1
+                   for i in range(len(landmarks))):
+                continue
+            landmarks.append(person)
+            distances.extend(array("h", graph.distances(person)))
+        return cls(landmarks, distances)
+
+    def save(self, filename, key):
+        write_arrays(filename, key, {
+            "landmarks": self.landmarks,
+            "distances": self.distances
+        })
+
+    @classmethod
+    def load(cls, filename, key=None):
+        sections = read_arrays(filename, key)
+        if sections is None:
+            return None
+        return cls(sections["landmarks"], sections["distances"])
+
+    def bounds(self, a, b):
+        """
+        Returns (lower, upper) bounds on the separation of people `a` and
+        `b`, where upper is None if no landmark reaches both of them.
+
+        Returns None if a landmark reaches exactly one of them, since
+        they cannot be connected.
+        """
+        lower = 0
+        upper = None
+        for i in range(len(self.landmarks)):
+            distance_a = self.distances[i * self.size + a]
+            distance_b = self.distances[i * self.size + b]
+            if (distance_a < 0) != (distance_b < 0):
+                return None
+            if distance_a < 0:
+                continue
+            lower = max(lower, abs(distance_a - distance_b))
+            if upper is None or distance_a + distance_b < upper:
+                upper = distance_a + distance_b
+        return lower, upper
+
+    def estimator(self, target):
+        """
+        Returns a function giving a lower bound on the separation of any
+        person from `target`, or None if they cannot be connected.
+        """
+        rows = [
+            (i * self.size, self.distances[i * self.size + target])
+            for i in range(len(self.landmarks))
+        ]
+        distances = self.distances
+
+        def estimate(person):
+            lower = 0
+            for offset, distance_target in rows:
+                distance = distances[offset + person]
+                if (distance < 0) != (distance_target < 0):
+                    return None
+                if distance >= 0 and abs(distance - distance_target) > lower:
+                    lower = abs(distance - distance_target)
+            return lower
+
+        return estimate
+
+    def pruner(self, source, target):
+        """
+        Returns a `prune(person, depth, forward)` function for a
+        bidirectional search between `source` and `target`.
+
+        It rejects people who cannot reach the far end, and people whose
+        `depth` plus lower bound to the far end exceeds the upper bound
+        on the whole path, since they cannot lie on a shortest path.
+
+        Returns None if `source` and `target` cannot be connected.
+        """
+        bounds = self.bounds(source, target)
+        if bounds is None:
+            return None
+        upper = bounds[1]
+        to_target = self.estimator(target)
+        to_source = self.estimator(source)
+
+        def prune(person, depth, forward):
+            lower = (to_target if forward else to_source)(person)
+            if lower is None:
+                return True
+            return upper is not None and depth + lower > upper
+
+        return prune
+
+
+def load_landmarks(directory, graph, count=8):
+    """
+    Returns the landmark index for `graph`, loaded from the data directory
+    if it is up to date, or built and saved there otherwise.
+    """
+    filename = os.path.join(directory, LANDMARKS)
+    key = {"data": snapshot_key(directory), "count": count}
+    if os.path.exists(filename):
+        index = LandmarkIndex.load(filename, key)
+        if index is not None:
+            return index
+
+    index = LandmarkIndex.build(graph, count)
+    try:
+        index.save(filename, key)
+    except OSError:
+        pass
+    return index
@@ -1,6 +1,17 @@
+import argparse
 import csv
+import glob
 import itertools
+import json
+import multiprocessing
+import os
 import sys
+import time
+from array import array
+
+import numpy as np
+
+from inference import eliminate_probabilities, inheritance_table
 
 PROBS = {
 
@@ -36,62 +47,691 @@ PROBS = {
     "mutation": 0.01
 }
 
+# Inference methods accepted by `main`
+METHODS = ("eliminate", "enumerate", "vectorize", "prune", "sample")
+
 
 def main():
 
     # Check for proper usage
-    if len(sys.argv) != 2:
-        sys.exit("Usage: python heredity.py data.csv")
-    people = load_data(sys.argv[1])
-
-    # Keep track of gene and trait probabilities for each person
-    probabilities = {
-        person: {
-            "gene": {
-                2: 0,
-                1: 0,
-                0: 0
-            },
-            "trait": {
-                True: 0,
-                False: 0
+    parser = argparse.ArgumentParser(
+        usage="python heredity.py [--method METHOD] [--standard-error SE] "
+              "[--batch [--output FILE] [--processes N]] data.csv"
+    )
+    parser.add_argument("data")
+    parser.add_argument("--method", choices=METHODS, default="eliminate",
+                        help="inference method (default: eliminate)")
+    parser.add_argument("--standard-error", type=float, default=0.005,
+                        help="target standard error when sampling")
+    parser.add_argument("--batch", action="store_true",
+                        help="treat data as a directory or glob of CSV files")
+    parser.add_argument("--output", metavar="FILE",
+                        help="batch results file, CSV if it ends in .csv, "
+                             "JSON lines otherwise (default: standard output)")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="number of batch worker processes")
+    args = parser.parse_args()
+
+    if args.batch:
+        filenames = family_files(args.data)
+        if args.output is None:
+            batch(filenames, sys.stdout, args.method, args.standard_error,
+                  args.processes)
+        else:
+            fmt = "csv" if args.output.endswith(".csv") else "json"
+            with open(args.output, "w", newline="") as f:
+                batch(filenames, f, args.method, args.standard_error,
+                      args.processes, fmt)
+        return
+
+    people = load_data(args.data)
+    probabilities, details = infer(people, args.method, args.standard_error)
+    if "sweeps" in details:
+        print(f"{details['sweeps']} Gibbs sweeps, largest standard error "
+              f"{details['standard_error']:.4f}")
+
+    # Print results
+    for person in people:
+        print(f"{person}:")
+        for field in probabilities[person]:
+            print(f"  {field.capitalize()}:")
+            for value in probabilities[person][field]:
+                p = probabilities[person][field][value]
+                print(f"    {value}: {p:.4f}")
+
+
+def infer(people, method="eliminate", standard_error=0.005):
+    """
+    Return a (probabilities, details) tuple of the gene and trait
+    distribution of each person in `people`, computed with `method`, and
+    a dictionary of anything else the method reports.
+    """
+    if method == "enumerate":
+        return enumerate_probabilities(people), {}
+    if method == "vectorize":
+        return vectorized_probabilities(people), {}
+    if method == "prune":
+        return pruned_probabilities(people), {}
+    if method == "sample":
+        probabilities, error, sweeps = sample_probabilities(
+            people, standard_error
+        )
+        return probabilities, {"standard_error": error, "sweeps": sweeps}
+    return eliminate_probabilities(people, PROBS), {}
+
+
+def family_files(pattern):
+    """
+    Return the sorted CSV files in directory `pattern`, or the files
+    matching it as a glob if it is not a directory.
+    """
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, "*.csv")
+    return sorted(glob.glob(pattern))
+
+
+def batch(filenames, output, method="eliminate", standard_error=0.005,
+          processes=None, fmt="json"):
+    """
+    Run inference on every family CSV in `filenames` across a process
+    pool, writing results to `output` in input order as they finish.
+
+    With `fmt` "json", each file gets one JSON object per line, holding
+    its distributions (or an error), and the seconds spent on loading and
+    inference. With "csv", each person gets one row.
+    """
+    tasks = ((filename, method, standard_error) for filename in filenames)
+    writer = None
+    if fmt == "csv":
+        writer = csv.writer(output)
+        writer.writerow([
+            "file", "name", "gene_2", "gene_1", "gene_0", "trait", "seconds",
+            "error"
+        ])
+
+    with multiprocessing.Pool(processes) as pool:
+        for result in pool.imap(solve, tasks, chunksize=16):
+            if writer is None:
+                output.write(json.dumps(result) + "\n")
+                continue
+            if "error" in result:
+                writer.writerow([result["file"], "", "", "", "", "",
+                                 result["seconds"], result["error"]])
+                continue
+            for name, distributions in result["people"].items():
+                genes = distributions["gene"]
+                writer.writerow([
+                    result["file"], name, genes[2], genes[1], genes[0],
+                    distributions["trait"][True], result["seconds"], ""
+                ])
+    output.flush()
+
+
+def solve(task):
+    """
+    Run inference on one family CSV for `batch` in a worker process, and
+    return a JSON-ready result.
+    """
+    filename, method, standard_error = task
+    start = time.perf_counter()
+    result = {"file": filename}
+    try:
+        people = load_data(filename)
+        probabilities, details = infer(people, method, standard_error)
+    except Exception as e:
+        # Any failure is reported for this file alone, so that one bad
+        # file does not stop the rest of the batch
+        result["error"] = f"{type(e).__name__}: {e}"
+    else:
+        result["people"] = {
+            name: {
+                "gene": {count: float(p) for count, p in
+                         probabilities[name]["gene"].items()},
+                "trait": {trait: float(p) for trait, p in
+                          probabilities[name]["trait"].items()}
             }
+            for name in probabilities
         }
-        for person in people
-    }
+        result.update(details)
+    result["seconds"] = time.perf_counter() - start
+    return result
 
-    # Loop over all sets of people who might have the trait
-    names = set(people)
-    for have_trait in powerset(names):
 
-        # Check if current set of people violates known information
-        fails_evidence = any(
-            (people[person]["trait"] is not None and
-             people[person]["trait"] != (person in have_trait))
-            for person in names
-        )
-        if fails_evidence:
-            continue
+def enumerate_probabilities(people):
+    """
+    Return the gene and trait distribution of each person in `people` by
+    summing the joint probability of every assignment of genes and traits
+    that agrees with the known traits.
+
+    Sets of people are generated one at a time as bitmasks over `people`
+    order, and sums go into arrays allocated up front, so memory use does
+    not grow with the number of assignments visited. Only the sums for
+    one copy, two copies and the trait are kept; the rest of each
+    distribution is what the overall total leaves.
+    """
+    names = list(people)
+    everyone = (1 << len(names)) - 1
+    known = sum(
+        1 << i for i, name in enumerate(names) if people[name]["trait"]
+    )
+    unknown = sum(
+        1 << i for i, name in enumerate(names)
+        if people[name]["trait"] is None
+    )
+
+    # Sums of joint probabilities, overall and for each person having one
+    # copy of the gene, two copies, and the trait
+    total = 0.0
+    one_totals = array("d", bytes(8 * len(names)))
+    two_totals = array("d", bytes(8 * len(names)))
+    trait_totals = array("d", bytes(8 * len(names)))
+
+    # Loop over all sets of people who might have the trait, keeping known
+    # traits as they are
+    for traits in submasks(unknown):
+        have_trait = known | traits
+        trait_set = members(have_trait, names)
+        trait_total = 0.0
 
         # Loop over all sets of people who might have the gene
-        for one_gene in powerset(names):
-            for two_genes in powerset(names - one_gene):
+        for one_gene in submasks(everyone):
+            one_set = members(one_gene, names)
+            one_total = 0.0
+            for two_genes in submasks(everyone & ~one_gene):
 
                 # Update probabilities with new joint probability
-                p = joint_probability(people, one_gene, two_genes, have_trait)
-                update(probabilities, one_gene, two_genes, have_trait, p)
+                p = joint_probability(people, one_set,
+                                      members(two_genes, names), trait_set)
+                accumulate(two_totals, two_genes, p)
+                one_total += p
+
+            # Sums for sets fixed by the outer loops are added once
+            accumulate(one_totals, one_gene, one_total)
+            trait_total += one_total
+        accumulate(trait_totals, have_trait, trait_total)
+        total += trait_total
 
     # Ensure probabilities sum to 1
-    normalize(probabilities)
+    probabilities = {}
+    for i, name in enumerate(names):
+        one = one_totals[i] / total
+        two = two_totals[i] / total
+        have_trait = trait_totals[i] / total
+        probabilities[name] = {
+            "gene": {2: two, 1: one, 0: max(0.0, 1 - one - two)},
+            "trait": {True: have_trait, False: max(0.0, 1 - have_trait)}
+        }
+    return probabilities
 
-    # Print results
+
+def vectorized_probabilities(people, chunk_size=1 << 16):
+    """
+    Return the same distributions as `enumerate_probabilities`, scoring
+    assignments in batches of `chunk_size` with `joint_log_probabilities`.
+
+    Assignment number i gives person j (i // 3 ** j) % 3 copies of the
+    gene, and the people with unknown traits take the remaining digits
+    of i in base 2 as their traits.
+    """
+    names = list(people)
+    known = np.array([people[name]["trait"] is True for name in names])
+    unknown = [
+        i for i, name in enumerate(names) if people[name]["trait"] is None
+    ]
+    total = 3 ** len(names) * 2 ** len(unknown)
+
+    gene_totals = np.zeros((len(names), 3))
+    trait_totals = np.zeros((len(names), 2))
+    sums = ScaledSums([gene_totals, trait_totals])
+
+    for start in range(0, total, chunk_size):
+        genes, rows = decode_genes(
+            start, min(start + chunk_size, total), len(names)
+        )
+        traits = np.tile(known, (len(genes), 1))
+        for i in unknown:
+            traits[:, i] = rows % 2
+            rows //= 2
+
+        weights = sums.weights(joint_log_probabilities(people, genes, traits))
+        if weights is None:
+            continue
+        for i in range(len(names)):
+            gene_totals[i] += np.bincount(genes[:, i], weights, minlength=3)
+            trait_totals[i] += np.bincount(traits[:, i], weights, minlength=2)
+
+    gene_totals /= gene_totals.sum(axis=1, keepdims=True)
+    trait_totals /= trait_totals.sum(axis=1, keepdims=True)
+    return {
+        name: {
+            "gene": {2: gene_totals[i, 2], 1: gene_totals[i, 1],
+                     0: gene_totals[i, 0]},
+            "trait": {True: trait_totals[i, 1], False: trait_totals[i, 0]}
+        }
+        for i, name in enumerate(names)
+    }
+
+
+def decode_genes(start, stop, n):
+    """
+    Return the gene counts of assignments `start` to `stop` as a k x n
+    array, where assignment i gives person j (i // 3 ** j) % 3 copies,
+    along with the array of each i // 3 ** n, its remaining digits.
+    """
+    rows = np.arange(start, stop)
+    genes = np.empty((len(rows), n), dtype=np.intp)
+    for i in range(n):
+        genes[:, i] = rows % 3
+        rows //= 3
+    return genes, rows
+
+
+class ScaledSums():
+    """
+    Running sums of probabilities given as logs, kept in the arrays
+    `totals` as sums of exp(log probability - scale), with scale the
+    largest log probability so far, so they neither underflow nor
+    overflow. Callers add the weights they get back to `totals`.
+    """
+
+    def __init__(self, totals):
+        self.totals = totals
+        self.scale = -np.inf
+
+    def weights(self, log_p):
+        """
+        Return exp(`log_p` - scale), first rescaling `totals` in place if
+        `log_p` raises the scale, or None if every `log_p` is -inf.
+        """
+        peak = log_p.max()
+        if peak == -np.inf:
+            return None
+        if peak > self.scale:
+            for total in self.totals:
+                total *= np.exp(self.scale - peak)
+            self.scale = peak
+        return np.exp(log_p - self.scale)
+
+
+def pruned_probabilities(people, chunk_size=1 << 16):
+    """
+    Return the same distributions as `enumerate_probabilities`, but only
+    enumerating what the known traits make necessary.
+
+    Each family (people connected by parent links) is solved on its own,
+    since families are independent. Within a family, only gene counts
+    are enumerated: known traits are fixed, and an unknown trait depends
+    on its person's genes alone, so its distribution follows from theirs.
+
+    People with no known trait among themselves and their descendants do
+    not change the probability of the evidence, so they are left out of
+    the enumeration. Their gene distributions are computed afterwards,
+    parents before children, for each assignment of everyone else.
+    """
+    probabilities = {}
+    for family in families(people):
+        probabilities.update(family_probabilities(family, chunk_size))
+    return {person: probabilities[person] for person in people}
+
+
+def families(people):
+    """
+    Return a list of dictionaries splitting `people` into families, the
+    groups of people connected through parents and children, with each
+    family's people in `people` order.
+    """
+    relatives = {person: [] for person in people}
     for person in people:
-        print(f"{person}:")
-        for field in probabilities[person]:
-            print(f"  {field.capitalize()}:")
-            for value in probabilities[person][field]:
-                p = probabilities[person][field][value]
-                print(f"    {value}: {p:.4f}")
+        for parent in (people[person]["mother"], people[person]["father"]):
+            if parent is not None:
+                relatives[person].append(parent)
+                relatives[parent].append(person)
+
+    family_of = {}
+    for person in people:
+        if person in family_of:
+            continue
+        family_of[person] = person
+        stack = [person]
+        while stack:
+            for relative in relatives[stack.pop()]:
+                if relative not in family_of:
+                    family_of[relative] = person
+                    stack.append(relative)
+
+    groups = {}
+    for person in people:
+        groups.setdefault(family_of[person], {})[person] = people[person]
+    return list(groups.values())
+
+
+def family_probabilities(people, chunk_size=1 << 16):
+    """
+    Return the distributions of one family for `pruned_probabilities`.
+    """
+    order = topological_order(people)
+
+    # People matter if they or any of their descendants have a known trait
+    children = {person: [] for person in people}
+    for person in people:
+        if people[person]["mother"] is not None:
+            children[people[person]["mother"]].append(person)
+            children[people[person]["father"]].append(person)
+    kept = set()
+    for person in reversed(order):
+        if (people[person]["trait"] is not None
+                or any(child in kept for child in children[person])):
+            kept.add(person)
+
+    # The rest are computed from their parents' distributions as if the
+    # parents were independent, so keep anyone whose parents share an
+    # ancestor that is not kept, along with those ancestors
+    while True:
+        ancestors = {}
+        tangled = set()
+        for person in order:
+            if person in kept:
+                continue
+            ancestors[person] = {person}
+            mother = people[person]["mother"]
+            father = people[person]["father"]
+            if mother is None:
+                continue
+            from_mother = ancestors.get(mother, set())
+            from_father = ancestors.get(father, set())
+            if from_mother & from_father:
+                tangled |= {person} | from_mother | from_father
+            ancestors[person] |= from_mother | from_father
+        if not tangled:
+            break
+        kept |= tangled
+
+    kept_people = {person: people[person] for person in order
+                   if person in kept}
+    kept_index = {person: i for i, person in enumerate(kept_people)}
+    inheritance = np.array(inheritance_table(PROBS))
+    prior = np.array([PROBS["gene"][count] for count in range(3)])
+
+    gene_totals = {person: np.zeros(3) for person in people}
+    sums = ScaledSums(list(gene_totals.values()))
+
+    total = 3 ** len(kept_people)
+    for start in range(0, total, chunk_size):
+        genes, rows = decode_genes(
+            start, min(start + chunk_size, total), len(kept_people)
+        )
+        weights = sums.weights(
+            evidence_log_probabilities(kept_people, genes)
+        )
+        if weights is None:
+            continue
+
+        distributions = {}
+        for person in order:
+            if person in kept:
+                distributions[person] = np.eye(3)[genes[:, kept_index[person]]]
+            elif people[person]["mother"] is None:
+                distributions[person] = np.tile(prior, (len(genes), 1))
+            else:
+                distributions[person] = np.einsum(
+                    "km,kf,mfc->kc",
+                    distributions[people[person]["mother"]],
+                    distributions[people[person]["father"]],
+                    inheritance
+                )
+            gene_totals[person] += weights @ distributions[person]
+
+    probabilities = {}
+    for person in people:
+        genes = gene_totals[person] / gene_totals[person].sum()
+        trait = people[person]["trait"]
+        if trait is None:
+            have_trait = sum(
+                genes[count] * PROBS["trait"][count][True]
+                for count in range(3)
+            )
+        else:
+            have_trait = 1.0 if trait else 0.0
+        probabilities[person] = {
+            "gene": {2: genes[2], 1: genes[1], 0: genes[0]},
+            "trait": {True: have_trait, False: 1 - have_trait}
+        }
+    return probabilities
+
+
+def sample_probabilities(people, standard_error=0.005, chains=1000,
+                         burn_in=50, max_sweeps=10000, rng=None):
+    """
+    Estimate the gene and trait distribution of each person in `people`
+    by Gibbs sampling, for pedigrees too large to solve exactly.
+
+    Each sweep redraws every person's gene count from its distribution
+    given everyone else's: their own inheritance (or prior), their known
+    trait, and the inheritance of each of their children. People who
+    share none of those terms are independent given the rest, so the
+    pedigree is split into groups of such people, and each group is
+    redrawn at once, as NumPy arrays over all `chains` chains.
+
+    The estimates average the conditional distributions, rather than the
+    drawn gene counts, over the sweeps after the first `burn_in`. Every
+    10 sweeps the chains are compared, and sampling stops once the
+    standard error of every estimate, taken across chains, is below
+    `standard_error`, or after `max_sweeps` sweeps.
+
+    Returns a (probabilities, error, sweeps) tuple of the distributions,
+    the largest standard error and the number of sweeps run.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    names = list(people)
+    index = {name: i for i, name in enumerate(names)}
+    mothers = np.array([
+        index.get(people[name]["mother"], -1) for name in names
+    ])
+    fathers = np.array([
+        index.get(people[name]["father"], -1) for name in names
+    ])
+    have_trait = np.array([PROBS["trait"][count][True] for count in range(3)])
+
+    # Arrays below have one row per gene count, so that work on each
+    # gene count is a contiguous block of memory
+    with np.errstate(divide="ignore"):
+        log_prior = np.log([PROBS["gene"][count] for count in range(3)])
+        inheritance = np.array(inheritance_table(PROBS))
+        log_inheritance = np.log(inheritance)
+        log_likelihood = np.zeros((3, len(names)))
+        for i, name in enumerate(names):
+            trait = people[name]["trait"]
+            if trait is not None:
+                log_likelihood[:, i] = np.log([
+                    PROBS["trait"][count][trait] for count in range(3)
+                ])
+
+    # Column 3 * mother's genes + father's genes holds the log probability
+    # of their child having each gene count
+    log_children = log_inheritance.reshape(9, 3).T
+
+    # Column 9 * role + 3 * other parent's genes + child's genes holds the
+    # log probability of the child's genes for each gene count of a
+    # parent, as father (role 0) or as mother (role 1)
+    log_parents = np.concatenate((
+        log_inheritance.transpose(0, 2, 1).reshape(9, 3),
+        log_inheritance.transpose(1, 2, 0).reshape(9, 3)
+    )).T
+
+    # Children of each person, as (child, other parent, role) triples
+    children = [[] for name in names]
+    for child in range(len(names)):
+        if mothers[child] >= 0:
+            children[mothers[child]].append((child, fathers[child], 1))
+            children[fathers[child]].append((child, mothers[child], 0))
+
+    groups = [
+        sampling_group(members, mothers, fathers, children)
+        for members in independent_groups(people)
+    ]
+
+    # Start every chain from a draw of the model without evidence, with
+    # one row of gene counts per person and one column per chain
+    genes = np.zeros((len(names), chains), dtype=np.intp)
+    for person in topological_order(people):
+        i = index[person]
+        if mothers[i] < 0:
+            weights = np.tile(np.exp(log_prior)[:, None], (1, chains))
+        else:
+            weights = inheritance[genes[mothers[i]], genes[fathers[i]]].T
+        genes[i] = draw(weights[:, None], rng)[0]
+
+    totals = np.zeros((3, len(names), chains))
+    counted = 0
+    error = np.inf
+    sweeps = 0
+    while sweeps < max_sweeps:
+        for group in groups:
+            members, founders, born, edges, starts, parents = group
+            weights = np.empty((3, len(members), chains))
+            weights[:, founders] = log_prior[:, None, None]
+            weights[:, born] = log_children[
+                :, 3 * genes[mothers[members[born]]]
+                + genes[fathers[members[born]]]
+            ]
+            weights += log_likelihood[:, members, None]
+            if len(edges):
+                child, other, role = edges
+                terms = log_parents[
+                    :, 9 * role[:, None] + 3 * genes[other] + genes[child]
+                ]
+                weights[:, parents] += np.add.reduceat(terms, starts, axis=1)
+
+            weights -= np.maximum(np.maximum(weights[0], weights[1]),
+                                  weights[2])
+            np.exp(weights, out=weights)
+            weights /= weights[0] + weights[1] + weights[2]
+            genes[members] = draw(weights, rng)
+            if sweeps >= burn_in:
+                totals[:, members] += weights
+        sweeps += 1
+        if sweeps > burn_in:
+            counted += 1
+
+        if counted and counted % 10 == 0:
+            means = totals / counted
+            estimates = np.concatenate(
+                (means, np.tensordot(have_trait, means, axes=1)[None])
+            )
+            error = (estimates.std(axis=2, ddof=1) / np.sqrt(chains)).max()
+            if error < standard_error:
+                break
+
+    genes = totals.sum(axis=2) / (chains * max(counted, 1))
+    probabilities = {}
+    for i, name in enumerate(names):
+        trait = people[name]["trait"]
+        if trait is None:
+            chance = float(genes[:, i] @ have_trait)
+        else:
+            chance = 1.0 if trait else 0.0
+        probabilities[name] = {
+            "gene": {2: genes[2, i], 1: genes[1, i], 0: genes[0, i]},
+            "trait": {True: chance, False: 1 - chance}
+        }
+    return probabilities, float(error), sweeps
+
+
+def independent_groups(people):
+    """
+    Split `people` into groups in which no two people are parent and
+    child or have a child together, greedily, so each group can be
+    redrawn at once by `sample_probabilities`.
+
+    Returns a list of arrays of indices into `people`.
+    """
+    names = list(people)
+    index = {name: i for i, name in enumerate(names)}
+    neighbors = [set() for name in names]
+    for name in names:
+        family = [name, people[name]["mother"], people[name]["father"]]
+        family = [index[member] for member in family if member is not None]
+        for member in family:
+            neighbors[member].update(family)
+
+    colors = [None] * len(names)
+    for i in range(len(names)):
+        taken = {colors[j] for j in neighbors[i] if j != i}
+        color = 0
+        while color in taken:
+            color += 1
+        colors[i] = color
+
+    groups = [[] for color in range(max(colors, default=-1) + 1)]
+    for i, color in enumerate(colors):
+        groups[color].append(i)
+    return [np.array(group) for group in groups]
+
+
+def sampling_group(members, mothers, fathers, children):
+    """
+    Precompute the index arrays `sample_probabilities` needs to redraw
+    the people in `members` at once.
+
+    Returns (members, founders, born, edges, starts, parents): positions
+    in `members` of people without and with parents, the (child, other
+    parent, role) arrays of all their children sorted by parent, where
+    each parent's children start, and positions of those parents.
+    """
+    founders = np.flatnonzero(mothers[members] < 0)
+    born = np.flatnonzero(mothers[members] >= 0)
+    edges = []
+    starts = []
+    parents = []
+    for position, person in enumerate(members):
+        if children[person]:
+            starts.append(len(edges))
+            parents.append(position)
+            edges.extend(children[person])
+    edges = tuple(np.array(column) for column in zip(*edges))
+    return (members, founders, born, edges, np.array(starts, dtype=np.intp),
+            np.array(parents, dtype=np.intp))
+
+
+def topological_order(people):
+    """
+    Return the names in `people` ordered so parents come before their
+    children.
+    """
+    order = []
+    placed = set()
+    for person in people:
+        stack = [person]
+        while stack:
+            current = stack[-1]
+            if current in placed:
+                stack.pop()
+                continue
+            parents = [
+                parent for parent in
+                (people[current]["mother"], people[current]["father"])
+                if parent is not None and parent not in placed
+            ]
+            if parents:
+                stack.extend(parents)
+                continue
+            placed.add(current)
+            order.append(current)
+            stack.pop()
+    return order
+
+
+def draw(weights, rng):
+    """
+    Draw gene counts from `weights`, a 3 x m x k array whose [g, i, j]
+    entry is the probability of gene count g in row i and column j,
+    returning an m x k array of gene counts.
+    """
+    first = weights[0]
+    second = first + weights[1]
+    u = rng.random(first.shape) * (second + weights[2])
+    return (u >= first).astype(np.intp) + (u >= second)
 
 
 def load_data(filename):
@@ -113,6 +753,16 @@ def load_data(filename):
                 "trait": (True if row["trait"] == "1" else
                           False if row["trait"] == "0" else None)
             }
+
+    # Every method relies on each person having no parents or two known ones
+    for name, person in data.items():
+        parents = (person["mother"], person["father"])
+        if parents != (None, None) and not all(
+            parent in data for parent in parents
+        ):
+            raise ValueError(
+                f"{name} must have both parents in the file, or neither"
+            )
     return data
 
 
@@ -128,6 +778,31 @@ def powerset(s):
     ]
 
 
+def submasks(mask):
+    """
+    Yield every bitmask whose set bits are a subset of those in `mask`,
+    from `mask` itself down to 0.
+    """
+    subset = mask
+    while True:
+        yield subset
+        if subset == 0:
+            return
+        subset = (subset - 1) & mask
+
+
+def members(mask, names):
+    """
+    Return the set of `names` whose positions are set bits of `mask`.
+    """
+    result = set()
+    while mask:
+        bit = mask & -mask
+        result.add(names[bit.bit_length() - 1])
+        mask ^= bit
+    return result
+
+
 def joint_probability(people, one_gene, two_genes, have_trait):
     """
     Compute and return a joint probability.
@@ -182,11 +857,11 @@ def joint_probability(people, one_gene, two_genes, have_trait):
                 
                 # when one parent has 1 gene and the other has 0 genes
                 elif (people[person]["father"] not in one_gene and people[person]["father"] not in two_genes and people[person]["mother"] in one_gene) or (people[person]["mother"] not in one_gene and people[person]["mother"] not in two_genes and people[person]["father"] in one_gene):
-                    mutation = 0.5 * PROBS["mutation"] + PROBS["mutation"] * 0.5
+                    mutation = 0.5 * PROBS["mutation"]
 
                 # when one parent has 0 gene and the other has 2 genes
                 elif (people[person]["father"] not in one_gene and people[person]["father"] not in two_genes and people[person]["mother"] in two_genes) or (people[person]["mother"] not in one_gene and people[person]["mother"] not in two_genes and people[person]["father"] in two_genes):
-                    mutation = PROBS["mutation"] + PROBS["mutation"]
+                    mutation = (1 - PROBS["mutation"]) * PROBS["mutation"]
 
                 # when both parents have 1 gene
                 elif people[person]["father"] in one_gene and people[person]["mother"] in one_gene:
@@ -194,7 +869,7 @@ def joint_probability(people, one_gene, two_genes, have_trait):
                     
                 # when one parent has 1 gene and the other has 2 genes
                 elif (people[person]["mother"] in one_gene and people[person]["father"] in two_genes) or (people[person]["father"] in one_gene and people[person]["mother"] in two_genes):
-                    mutation = 0.5 * 0.5
+                    mutation = 0.5 * (1 - PROBS["mutation"])
                     
                 # when both parents have 2 genes
                 elif people[person]["father"] in two_genes and people[person]["mother"] in two_genes:
@@ -265,6 +940,70 @@ def joint_probability(people, one_gene, two_genes, have_trait):
     return joint_prob
 
 
+def joint_log_probabilities(people, genes, traits):
+    """
+    Compute the log of `joint_probability` for many assignments at once.
+
+    `genes` is a k x n integer array of gene counts, and `traits` a k x n
+    boolean array, with one row per assignment and one column per person
+    in `people` order. Returns an array of k log probabilities, each the
+    sum of the log probabilities of every person's gene and trait.
+    """
+    with np.errstate(divide="ignore"):
+        log_trait = np.log([
+            [PROBS["trait"][count][False], PROBS["trait"][count][True]]
+            for count in range(3)
+        ])
+    log_p = log_trait[genes, traits.astype(np.intp)].sum(axis=1)
+    return log_p + gene_log_probabilities(people, genes)
+
+
+def gene_log_probabilities(people, genes):
+    """
+    Return the log probability of each row of gene counts in `genes`, a
+    k x n array laid out as for `joint_log_probabilities`, ignoring traits.
+    Every parent of a person in `people` must also be in `people`.
+    """
+    names = list(people)
+    index = {name: i for i, name in enumerate(names)}
+    founders = [
+        i for i, name in enumerate(names) if people[name]["mother"] is None
+    ]
+    children = [
+        i for i, name in enumerate(names)
+        if people[name]["mother"] is not None
+    ]
+    mothers = [index[people[names[i]]["mother"]] for i in children]
+    fathers = [index[people[names[i]]["father"]] for i in children]
+
+    with np.errstate(divide="ignore"):
+        log_gene = np.log([PROBS["gene"][count] for count in range(3)])
+        log_inheritance = np.log(np.array(inheritance_table(PROBS)))
+
+    log_p = log_gene[genes[:, founders]].sum(axis=1)
+    log_p += log_inheritance[
+        genes[:, mothers], genes[:, fathers], genes[:, children]
+    ].sum(axis=1)
+    return log_p
+
+
+def evidence_log_probabilities(people, genes):
+    """
+    Return the log probability of each row of gene counts in `genes`
+    together with the known traits, so people with unknown traits do not
+    need their traits enumerated.
+    """
+    log_p = gene_log_probabilities(people, genes)
+    with np.errstate(divide="ignore"):
+        for i, name in enumerate(people):
+            trait = people[name]["trait"]
+            if trait is not None:
+                log_p += np.log([
+                    PROBS["trait"][count][trait] for count in range(3)
+                ])[genes[:, i]]
+    return log_p
+
+
 def update(probabilities, one_gene, two_genes, have_trait, p):
     """
     Add to `probabilities` a new joint probability `p`.
@@ -285,6 +1024,17 @@ def update(probabilities, one_gene, two_genes, have_trait, p):
             probabilities[person]["trait"][False] += p
 
 
+def accumulate(totals, mask, p):
+    """
+    Bitmask counterpart of `update`: add joint probability `p` to
+    `totals[i]` for every set bit i of `mask`.
+    """
+    while mask:
+        bit = mask & -mask
+        totals[bit.bit_length() - 1] += p
+        mask ^= bit
+
+
 def normalize(probabilities):
     """
     Update `probabilities` such that each probability distribution
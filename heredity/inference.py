@@ -0,0 +1,258 @@
+import heapq
+import itertools
+import operator
+
+# Each person has 0, 1 or 2 copies of the gene
+GENES = (0, 1, 2)
+
+
+class Factor():
+    """
+    A nonnegative function of the gene counts of some people.
+
+    `values` lists the function at every assignment of GENES to
+    `variables`, in `itertools.product` order, so the last variable
+    changes fastest.
+    """
+
+    def __init__(self, variables, values):
+        self.variables = tuple(variables)
+        self.values = values
+
+    def strides(self, variables):
+        """
+        Returns, for each of `variables`, how far apart in `values` are
+        entries that differ by one in that variable, or 0 for variables
+        this factor does not depend on.
+        """
+        stride = {}
+        step = 1
+        for variable in reversed(self.variables):
+            stride[variable] = step
+            step *= len(GENES)
+        return [stride.get(variable, 0) for variable in variables]
+
+    def multiply(self, other):
+        """
+        Returns the product of this factor and `other`.
+        """
+        variables = self.variables + tuple(
+            variable for variable in other.variables
+            if variable not in self.variables
+        )
+        mine = self.strides(variables)
+        theirs = other.strides(variables)
+        values = []
+        for assignment in itertools.product(GENES, repeat=len(variables)):
+            values.append(
+                self.values[sum(map(operator.mul, assignment, mine))]
+                * other.values[sum(map(operator.mul, assignment, theirs))]
+            )
+        return Factor(variables, values)
+
+    def marginal(self, variables):
+        """
+        Returns this factor with every variable not in `variables` summed
+        out, and constant along any of `variables` it does not depend on.
+        """
+        missing = [
+            variable for variable in variables
+            if variable not in self.variables
+        ]
+        if missing:
+            constant = Factor(missing, [1.0] * len(GENES) ** len(missing))
+            return self.multiply(constant).marginal(variables)
+
+        strides = Factor(variables, None).strides(self.variables)
+        values = [0.0] * len(GENES) ** len(variables)
+        assignments = itertools.product(GENES, repeat=len(self.variables))
+        for assignment, value in zip(assignments, self.values):
+            values[sum(map(operator.mul, assignment, strides))] += value
+        return Factor(variables, values)
+
+    def normalized(self):
+        """
+        Returns this factor scaled to sum to 1.
+        """
+        total = sum(self.values)
+        return Factor(self.variables, [value / total for value in self.values])
+
+
+# Factor of no variables, the identity for `Factor.multiply`
+UNIT = Factor((), [1.0])
+
+
+def inheritance_table(probs):
+    """
+    Returns nested lists whose [mother][father][child] entry is the
+    probability that a child of parents with `mother` and `father` copies
+    of the gene has `child` copies.
+    """
+    mutation = probs["mutation"]
+
+    # Probability that a parent with each gene count passes the gene on
+    passes = {0: mutation, 1: 0.5, 2: 1 - mutation}
+    table = []
+    for mother in GENES:
+        table.append([])
+        for father in GENES:
+            from_mother = passes[mother]
+            from_father = passes[father]
+            table[-1].append([
+                (1 - from_mother) * (1 - from_father),
+                from_mother * (1 - from_father)
+                + (1 - from_mother) * from_father,
+                from_mother * from_father
+            ])
+    return table
+
+
+def evidence(probs, trait):
+    """
+    Returns the likelihood of a known `trait` (or of no evidence, if
+    `trait` is None) for each gene count.
+    """
+    if trait is None:
+        return [1.0 for genes in GENES]
+    return [probs["trait"][genes][trait] for genes in GENES]
+
+
+def family_factors(people, probs):
+    """
+    Returns one factor per person: the probability of their gene count
+    given their parents' (or unconditionally, without parents), times
+    the likelihood of their known trait.
+    """
+    inheritance = inheritance_table(probs)
+    factors = []
+    for person in people:
+        likelihood = evidence(probs, people[person]["trait"])
+        mother = people[person]["mother"]
+        father = people[person]["father"]
+        if mother is None:
+            factors.append(Factor((person,), [
+                probs["gene"][genes] * likelihood[genes] for genes in GENES
+            ]))
+            continue
+        factors.append(Factor((person, mother, father), [
+            inheritance[m][f][genes] * likelihood[genes]
+            for genes in GENES for m in GENES for f in GENES
+        ]))
+    return factors
+
+
+def elimination_order(people):
+    """
+    Returns a (person, neighbors) list giving an order in which to sum
+    out people's gene counts, picking whoever has the fewest neighbors
+    first, along with the neighbors they have when summed out.
+
+    People are neighbors if they share a family factor: parents are
+    neighbors of their children and of each other. Summing out a person
+    makes all of their neighbors neighbors.
+    """
+    neighbors = {person: set() for person in people}
+    for person in people:
+        family = {person, people[person]["mother"], people[person]["father"]}
+        family.discard(None)
+        for member in family:
+            neighbors[member] |= family - {member}
+
+    index = {person: i for i, person in enumerate(people)}
+    heap = [(len(neighbors[person]), index[person], person)
+            for person in people]
+    heapq.heapify(heap)
+    order = []
+    while heap:
+        degree, _, person = heapq.heappop(heap)
+        if person not in neighbors or degree != len(neighbors[person]):
+            continue
+        scope = neighbors.pop(person)
+        for neighbor in scope:
+            neighbors[neighbor].discard(person)
+            neighbors[neighbor] |= scope - {neighbor}
+            heapq.heappush(heap, (len(neighbors[neighbor]), index[neighbor],
+                                  neighbor))
+        order.append((person, scope))
+    return order
+
+
+def eliminate_probabilities(people, probs):
+    """
+    Returns the gene and trait distribution of each person in `people`,
+    given the known traits, computed exactly by belief propagation on
+    the clique tree built by variable elimination.
+
+    Summing out each person in `elimination_order` defines a clique of
+    that person and their neighbors, and the message it passes on, over
+    the neighbors alone, goes to the clique of whichever neighbor is
+    summed out next. One pass of messages up this tree and one pass back
+    down leave every clique with the joint distribution of its people.
+
+    Without loops in the pedigree, such as cousin marriages, cliques have
+    at most 3 people, so the work is linear in the size of the pedigree.
+    """
+    order = elimination_order(people)
+    position = {person: i for i, (person, scope) in enumerate(order)}
+    scopes = {
+        person: tuple(sorted(scope, key=position.get))
+        for person, scope in order
+    }
+
+    # Each clique's parent in the tree, and the factors it starts with
+    children = {person: [] for person in people}
+    parent = {}
+    for person, scope in scopes.items():
+        if scope:
+            parent[person] = scope[0]
+            children[scope[0]].append(person)
+    potentials = {person: UNIT for person in people}
+    for factor in family_factors(people, probs):
+        first = min(factor.variables, key=position.get)
+        potentials[first] = potentials[first].multiply(factor)
+
+    # Messages from each clique up to its parent, in elimination order
+    up = {}
+    for person, scope in order:
+        belief = potentials[person]
+        for child in children[person]:
+            belief = belief.multiply(up[child])
+        if person in parent:
+            up[person] = belief.marginal(scopes[person]).normalized()
+
+    # Messages from each clique down to its children, combining all other
+    # messages into the clique with prefix and suffix products
+    down = {}
+    beliefs = {}
+    for person, scope in reversed(order):
+        belief = potentials[person]
+        if person in parent:
+            belief = belief.multiply(down[person])
+        messages = [up[child] for child in children[person]]
+        suffixes = [UNIT]
+        for message in reversed(messages):
+            suffixes.append(message.multiply(suffixes[-1]))
+        suffixes.reverse()
+        for i, child in enumerate(children[person]):
+            down[child] = (
+                belief.multiply(suffixes[i + 1])
+                .marginal(scopes[child]).normalized()
+            )
+            belief = belief.multiply(messages[i])
+        beliefs[person] = belief
+
+    probabilities = {}
+    for person in people:
+        genes = beliefs[person].marginal((person,)).normalized().values
+        trait = people[person]["trait"]
+        if trait is None:
+            have_trait = sum(
+                genes[count] * probs["trait"][count][True] for count in GENES
+            )
+        else:
+            have_trait = 1.0 if trait else 0.0
+        probabilities[person] = {
+            "gene": {2: genes[2], 1: genes[1], 0: genes[0]},
+            "trait": {True: have_trait, False: 1 - have_trait}
+        }
+    return probabilities
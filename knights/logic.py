@@ -1,19 +1,100 @@
 import itertools
+import weakref
 
 
 class Sentence():
+    """
+    Sentences are immutable and hash-consed: constructing a sentence
+    equal to one that already exists returns the existing node, so equal
+    subformulas share one node, and each node computes its hash, symbols
+    and formula once.
+
+    The exception is the And or Or a program builds up with `add`, such
+    as a knowledge base. Each call to And or Or makes a separate node
+    that can grow, and any sentence built on it holds a shared, frozen
+    copy of it as it was at the time instead.
+
+    This changes earlier behavior in two ways. A sentence built on an
+    And or Or no longer sees conjuncts or disjuncts added to it later,
+    so build knowledge bases fully before using them inside other
+    sentences. And `add` on the frozen copy, such as
+    `Not(knowledge).operand.add(...)`, raises TypeError.
+
+    Pickling or copying a sentence constructs it again from its
+    operands, so shared nodes stay shared and an And or Or comes back
+    able to grow.
+    """
+
+    __slots__ = ("__weakref__", "_hash", "_symbols", "_formula")
+
+    # Shared nodes, keyed by class and by name or operand identities
+    nodes = weakref.WeakValueDictionary()
+
+    def __new__(cls, *args):
+        sentence = super().__new__(cls)
+        sentence._hash = None
+        sentence._symbols = None
+        sentence._formula = None
+        return sentence
 
     def evaluate(self, model):
         """Evaluates the logical sentence."""
         raise Exception("nothing to evaluate")
 
+    def evaluate_partial(self, model):
+        """
+        Evaluates the logical sentence in a model that may leave some
+        symbols unassigned, returning None if its value depends on them.
+        """
+        raise Exception("nothing to evaluate")
+
     def formula(self):
         """Returns string formula representing logical sentence."""
         return ""
 
+    def __reduce__(self):
+        # Pickle and copy by constructing again from the operands, so that
+        # shared nodes stay shared and cached hashes, which differ between
+        # processes, are never carried over
+        return (type(self), self.__getnewargs__())
+
+    def __getnewargs__(self):
+        return ()
+
+    def operands(self):
+        """Returns the sentences this sentence is made of."""
+        return ()
+
+    def shared(self):
+        """Returns the shared node equal to this sentence."""
+        return self
+
     def symbols(self):
         """Returns a set of all symbols in the logical sentence."""
-        return set()
+        if self._symbols is None:
+            self._symbols = frozenset().union(*[
+                operand.symbol_set() for operand in self.operands()
+            ])
+        return set(self._symbols)
+
+    def symbol_set(self):
+        """Returns the cached, frozen set of symbols in the sentence."""
+        if self._symbols is None:
+            self.symbols()
+        return self._symbols
+
+    @classmethod
+    def intern(cls, key, *operands):
+        """
+        Returns the shared node of class `cls` for `key`, creating it
+        from `operands` if there is none.
+        """
+        sentence = Sentence.nodes.get(key)
+        if sentence is None:
+            sentence = Sentence.__new__(cls)
+            sentence.build(*operands)
+            Sentence.nodes[key] = sentence
+        return sentence
 
     @classmethod
     def validate(cls, sentence):
@@ -44,14 +125,26 @@ class Sentence():
 
 class Symbol(Sentence):
 
-    def __init__(self, name):
+    __slots__ = ("name",)
+
+    def __new__(cls, name):
+        return cls.intern((cls, name), name)
+
+    def build(self, name):
         self.name = name
 
+    def __getnewargs__(self):
+        return (self.name,)
+
     def __eq__(self, other):
-        return isinstance(other, Symbol) and self.name == other.name
+        return self is other or (
+            isinstance(other, Symbol) and self.name == other.name
+        )
 
     def __hash__(self):
-        return hash(("symbol", self.name))
+        if self._hash is None:
+            self._hash = hash(("symbol", self.name))
+        return self._hash
 
     def __repr__(self):
         return self.name
@@ -62,23 +155,44 @@ class Symbol(Sentence):
         except KeyError:
             raise Exception(f"variable {self.name} not in model")
 
+    def evaluate_partial(self, model):
+        if self.name not in model:
+            return None
+        return bool(model[self.name])
+
     def formula(self):
         return self.name
 
     def symbols(self):
+        if self._symbols is None:
+            self._symbols = frozenset((self.name,))
         return {self.name}
 
 
 class Not(Sentence):
-    def __init__(self, operand):
+
+    __slots__ = ("operand",)
+
+    def __new__(cls, operand):
         Sentence.validate(operand)
+        operand = operand.shared()
+        return cls.intern((cls, id(operand)), operand)
+
+    def build(self, operand):
         self.operand = operand
 
+    def __getnewargs__(self):
+        return (self.operand,)
+
     def __eq__(self, other):
-        return isinstance(other, Not) and self.operand == other.operand
+        return self is other or (
+            isinstance(other, Not) and self.operand == other.operand
+        )
 
     def __hash__(self):
-        return hash(("not", hash(self.operand)))
+        if self._hash is None:
+            self._hash = hash(("not", hash(self.operand)))
+        return self._hash
 
     def __repr__(self):
         return f"Not({self.operand})"
@@ -86,26 +200,51 @@ class Not(Sentence):
     def evaluate(self, model):
         return not self.operand.evaluate(model)
 
+    def evaluate_partial(self, model):
+        value = self.operand.evaluate_partial(model)
+        return None if value is None else not value
+
     def formula(self):
-        return "¬" + Sentence.parenthesize(self.operand.formula())
+        if self._formula is None:
+            self._formula = (
+                "¬" + Sentence.parenthesize(self.operand.formula())
+            )
+        return self._formula
 
-    def symbols(self):
-        return self.operand.symbols()
+    def operands(self):
+        return (self.operand,)
 
 
 class And(Sentence):
-    def __init__(self, *conjuncts):
+
+    __slots__ = ("conjuncts", "frozen")
+
+    def __new__(cls, *conjuncts):
         for conjunct in conjuncts:
             Sentence.validate(conjunct)
-        self.conjuncts = list(conjuncts)
+        sentence = super().__new__(cls)
+        sentence.build([conjunct.shared() for conjunct in conjuncts])
+        sentence.frozen = False
+        return sentence
+
+    def build(self, conjuncts):
+        self.conjuncts = conjuncts
+        self.frozen = True
+
+    def __getnewargs__(self):
+        return tuple(self.conjuncts)
 
     def __eq__(self, other):
-        return isinstance(other, And) and self.conjuncts == other.conjuncts
+        return self is other or (
+            isinstance(other, And) and self.conjuncts == other.conjuncts
+        )
 
     def __hash__(self):
-        return hash(
-            ("and", tuple(hash(conjunct) for conjunct in self.conjuncts))
-        )
+        if self._hash is None:
+            self._hash = hash(
+                ("and", tuple(hash(conjunct) for conjunct in self.conjuncts))
+            )
+        return self._hash
 
     def __repr__(self):
         conjunctions = ", ".join(
@@ -115,66 +254,157 @@ class And(Sentence):
 
     def add(self, conjunct):
         Sentence.validate(conjunct)
-        self.conjuncts.append(conjunct)
+        if self.frozen:
+            raise TypeError("cannot add to a shared sentence")
+        self.conjuncts.append(conjunct.shared())
+        self._hash = None
+        self._symbols = None
+        self._formula = None
+
+    def shared(self):
+        if self.frozen:
+            return self
+        key = (And, tuple(id(conjunct) for conjunct in self.conjuncts))
+        return And.intern(key, list(self.conjuncts))
 
     def evaluate(self, model):
         return all(conjunct.evaluate(model) for conjunct in self.conjuncts)
 
+    def evaluate_partial(self, model):
+        result = True
+        for conjunct in self.conjuncts:
+            value = conjunct.evaluate_partial(model)
+            if value is False:
+                return False
+            if value is None:
+                result = None
+        return result
+
     def formula(self):
-        if len(self.conjuncts) == 1:
-            return self.conjuncts[0].formula()
-        return " ∧ ".join([Sentence.parenthesize(conjunct.formula())
-                           for conjunct in self.conjuncts])
+        if self._formula is None:
+            if len(self.conjuncts) == 1:
+                self._formula = self.conjuncts[0].formula()
+            else:
+                self._formula = " ∧ ".join([
+                    Sentence.parenthesize(conjunct.formula())
+                    for conjunct in self.conjuncts
+                ])
+        return self._formula
 
-    def symbols(self):
-        return set.union(*[conjunct.symbols() for conjunct in self.conjuncts])
+    def operands(self):
+        return self.conjuncts
 
 
 class Or(Sentence):
-    def __init__(self, *disjuncts):
+
+    __slots__ = ("disjuncts", "frozen")
+
+    def __new__(cls, *disjuncts):
         for disjunct in disjuncts:
             Sentence.validate(disjunct)
-        self.disjuncts = list(disjuncts)
+        sentence = super().__new__(cls)
+        sentence.build([disjunct.shared() for disjunct in disjuncts])
+        sentence.frozen = False
+        return sentence
+
+    def build(self, disjuncts):
+        self.disjuncts = disjuncts
+        self.frozen = True
+
+    def __getnewargs__(self):
+        return tuple(self.disjuncts)
 
     def __eq__(self, other):
-        return isinstance(other, Or) and self.disjuncts == other.disjuncts
+        return self is other or (
+            isinstance(other, Or) and self.disjuncts == other.disjuncts
+        )
 
     def __hash__(self):
-        return hash(
-            ("or", tuple(hash(disjunct) for disjunct in self.disjuncts))
-        )
+        if self._hash is None:
+            self._hash = hash(
+                ("or", tuple(hash(disjunct) for disjunct in self.disjuncts))
+            )
+        return self._hash
 
     def __repr__(self):
         disjuncts = ", ".join([str(disjunct) for disjunct in self.disjuncts])
         return f"Or({disjuncts})"
 
+    def add(self, disjunct):
+        Sentence.validate(disjunct)
+        if self.frozen:
+            raise TypeError("cannot add to a shared sentence")
+        self.disjuncts.append(disjunct.shared())
+        self._hash = None
+        self._symbols = None
+        self._formula = None
+
+    def shared(self):
+        if self.frozen:
+            return self
+        key = (Or, tuple(id(disjunct) for disjunct in self.disjuncts))
+        return Or.intern(key, list(self.disjuncts))
+
     def evaluate(self, model):
         return any(disjunct.evaluate(model) for disjunct in self.disjuncts)
 
+    def evaluate_partial(self, model):
+        result = False
+        for disjunct in self.disjuncts:
+            value = disjunct.evaluate_partial(model)
+            if value is True:
+                return True
+            if value is None:
+                result = None
+        return result
+
     def formula(self):
-        if len(self.disjuncts) == 1:
-            return self.disjuncts[0].formula()
-        return " ∨  ".join([Sentence.parenthesize(disjunct.formula())
-                            for disjunct in self.disjuncts])
+        if self._formula is None:
+            if len(self.disjuncts) == 1:
+                self._formula = self.disjuncts[0].formula()
+            else:
+                self._formula = " ∨  ".join([
+                    Sentence.parenthesize(disjunct.formula())
+                    for disjunct in self.disjuncts
+                ])
+        return self._formula
 
-    def symbols(self):
-        return set.union(*[disjunct.symbols() for disjunct in self.disjuncts])
+    def operands(self):
+        return self.disjuncts
 
 
 class Implication(Sentence):
-    def __init__(self, antecedent, consequent):
+
+    __slots__ = ("antecedent", "consequent")
+
+    def __new__(cls, antecedent, consequent):
         Sentence.validate(antecedent)
         Sentence.validate(consequent)
+        antecedent = antecedent.shared()
+        consequent = consequent.shared()
+        key = (cls, id(antecedent), id(consequent))
+        return cls.intern(key, antecedent, consequent)
+
+    def build(self, antecedent, consequent):
         self.antecedent = antecedent
         self.consequent = consequent
 
+    def __getnewargs__(self):
+        return (self.antecedent, self.consequent)
+
     def __eq__(self, other):
-        return (isinstance(other, Implication)
-                and self.antecedent == other.antecedent
-                and self.consequent == other.consequent)
+        return self is other or (
+            isinstance(other, Implication)
+            and self.antecedent == other.antecedent
+            and self.consequent == other.consequent
+        )
 
     def __hash__(self):
-        return hash(("implies", hash(self.antecedent), hash(self.consequent)))
+        if self._hash is None:
+            self._hash = hash(
+                ("implies", hash(self.antecedent), hash(self.consequent))
+            )
+        return self._hash
 
     def __repr__(self):
         return f"Implication({self.antecedent}, {self.consequent})"
@@ -183,46 +413,85 @@ class Implication(Sentence):
         return ((not self.antecedent.evaluate(model))
                 or self.consequent.evaluate(model))
 
+    def evaluate_partial(self, model):
+        antecedent = self.antecedent.evaluate_partial(model)
+        if antecedent is False:
+            return True
+        consequent = self.consequent.evaluate_partial(model)
+        if consequent is True:
+            return True
+        if antecedent is None or consequent is None:
+            return None
+        return False
+
     def formula(self):
-        antecedent = Sentence.parenthesize(self.antecedent.formula())
-        consequent = Sentence.parenthesize(self.consequent.formula())
-        return f"{antecedent} => {consequent}"
+        if self._formula is None:
+            antecedent = Sentence.parenthesize(self.antecedent.formula())
+            consequent = Sentence.parenthesize(self.consequent.formula())
+            self._formula = f"{antecedent} => {consequent}"
+        return self._formula
 
-    def symbols(self):
-        return set.union(self.antecedent.symbols(), self.consequent.symbols())
+    def operands(self):
+        return (self.antecedent, self.consequent)
 
 
 class Biconditional(Sentence):
-    def __init__(self, left, right):
+
+    __slots__ = ("left", "right")
+
+    def __new__(cls, left, right):
         Sentence.validate(left)
         Sentence.validate(right)
+        left = left.shared()
+        right = right.shared()
+        key = (cls, id(left), id(right))
+        return cls.intern(key, left, right)
+
+    def build(self, left, right):
         self.left = left
         self.right = right
 
+    def __getnewargs__(self):
+        return (self.left, self.right)
+
     def __eq__(self, other):
-        return (isinstance(other, Biconditional)
-                and self.left == other.left
-                and self.right == other.right)
+        return self is other or (
+            isinstance(other, Biconditional)
+            and self.left == other.left
+            and self.right == other.right
+        )
 
     def __hash__(self):
-        return hash(("biconditional", hash(self.left), hash(self.right)))
+        if self._hash is None:
+            self._hash = hash(
+                ("biconditional", hash(self.left), hash(self.right))
+            )
+        return self._hash
 
     def __repr__(self):
         return f"Biconditional({self.left}, {self.right})"
 
     def evaluate(self, model):
-        return ((self.left.evaluate(model)
-                 and self.right.evaluate(model))
-                or (not self.left.evaluate(model)
-                    and not self.right.evaluate(model)))
+        return self.left.evaluate(model) == self.right.evaluate(model)
+
+    def evaluate_partial(self, model):
+        left = self.left.evaluate_partial(model)
+        if left is None:
+            return None
+        right = self.right.evaluate_partial(model)
+        if right is None:
+            return None
+        return left == right
 
     def formula(self):
-        left = Sentence.parenthesize(str(self.left))
-        right = Sentence.parenthesize(str(self.right))
-        return f"{left} <=> {right}"
+        if self._formula is None:
+            left = Sentence.parenthesize(str(self.left))
+            right = Sentence.parenthesize(str(self.right))
+            self._formula = f"{left} <=> {right}"
+        return self._formula
 
-    def symbols(self):
-        return set.union(self.left.symbols(), self.right.symbols())
+    def operands(self):
+        return (self.left, self.right)
 
 
 def model_check(knowledge, query):
@@ -231,33 +500,153 @@ def model_check(knowledge, query):
     def check_all(knowledge, query, symbols, model):
         """Checks if knowledge base entails query, given a particular model."""
 
-        # If model has an assignment for each symbol
-        if not symbols:
+        # If knowledge base is false whatever the remaining symbols are,
+        # no model extending this one needs checking
+        known = knowledge.evaluate_partial(model)
+        if known is False:
+            return True
 
-            # If knowledge base is true in model, then query must also be true
-            if knowledge.evaluate(model):
-                return query.evaluate(model)
+        # Likewise if query is already true
+        answer = query.evaluate_partial(model)
+        if answer is True:
             return True
-        else:
 
-            # Choose one of the remaining unused symbols
-            remaining = symbols.copy()
-            p = remaining.pop()
+        # If knowledge base is true in model, then query must also be true
+        if known is True and answer is False:
+            return False
 
-            # Create a model where the symbol is true
-            model_true = model.copy()
-            model_true[p] = True
+        # Otherwise some symbol is still unassigned: choose one of them
+        remaining = symbols.copy()
+        p = remaining.pop()
 
-            # Create a model where the symbol is false
-            model_false = model.copy()
-            model_false[p] = False
+        # Create a model where the symbol is true
+        model_true = model.copy()
+        model_true[p] = True
 
-            # Ensure entailment holds in both models
-            return (check_all(knowledge, query, remaining, model_true) and
-                    check_all(knowledge, query, remaining, model_false))
+        # Create a model where the symbol is false
+        model_false = model.copy()
+        model_false[p] = False
+
+        # Ensure entailment holds in both models
+        return (check_all(knowledge, query, remaining, model_true) and
+                check_all(knowledge, query, remaining, model_false))
 
     # Get all symbols in both knowledge and query
     symbols = set.union(knowledge.symbols(), query.symbols())
 
     # Check that knowledge entails query
     return check_all(knowledge, query, symbols, dict())
+
+
+class Program():
+    """
+    Sentences compiled to a flat list of instructions over symbols
+    numbered 0, 1, 2, ... in `symbols` order.
+
+    Each instruction computes one distinct subsentence, once, from the
+    results of earlier instructions, using only &, | and ^. Running the
+    program on words whose bits are separate models, such as Python
+    integers or NumPy unsigned integer arrays, evaluates all of those
+    models at once.
+    """
+
+    SYMBOL, NOT, AND, OR, IMPLIES, IFF = range(6)
+
+    def __init__(self, sentences, symbols=None):
+        if symbols is None:
+            symbols = sorted(set().union(
+                *[sentence.symbols() for sentence in sentences]
+            ))
+        self.symbols = list(symbols)
+        self.index = {name: i for i, name in enumerate(self.symbols)}
+        self.instructions = []
+        self.registers = {}
+        self.outputs = [self.emit(sentence) for sentence in sentences]
+
+    def emit(self, sentence):
+        """Returns the register holding sentence, adding instructions."""
+        if sentence in self.registers:
+            return self.registers[sentence]
+        if isinstance(sentence, Symbol):
+            try:
+                instruction = (Program.SYMBOL, self.index[sentence.name])
+            except KeyError:
+                raise Exception(f"variable {sentence.name} not in model")
+        elif isinstance(sentence, Not):
+            instruction = (Program.NOT, self.emit(sentence.operand))
+        elif isinstance(sentence, And):
+            instruction = (Program.AND, tuple(
+                self.emit(conjunct) for conjunct in sentence.conjuncts
+            ))
+        elif isinstance(sentence, Or):
+            instruction = (Program.OR, tuple(
+                self.emit(disjunct) for disjunct in sentence.disjuncts
+            ))
+        elif isinstance(sentence, Implication):
+            instruction = (Program.IMPLIES, (self.emit(sentence.antecedent),
+                                             self.emit(sentence.consequent)))
+        elif isinstance(sentence, Biconditional):
+            instruction = (Program.IFF, (self.emit(sentence.left),
+                                         self.emit(sentence.right)))
+        else:
+            raise TypeError("must be a logical sentence")
+        self.instructions.append(instruction)
+        self.registers[sentence] = len(self.instructions) - 1
+        return self.registers[sentence]
+
+    def run(self, inputs, ones):
+        """
+        Returns the value of each sentence, given the value of each
+        symbol in `inputs` and a word `ones` with every bit set.
+        """
+        values = []
+        for opcode, operand in self.instructions:
+            if opcode == Program.SYMBOL:
+                value = inputs[operand]
+            elif opcode == Program.NOT:
+                value = values[operand] ^ ones
+            elif opcode == Program.AND:
+                value = ones
+                for register in operand:
+                    value = value & values[register]
+            elif opcode == Program.OR:
+                value = ones ^ ones
+                for register in operand:
+                    value = value | values[register]
+            elif opcode == Program.IMPLIES:
+                value = (values[operand[0]] ^ ones) | values[operand[1]]
+            else:
+                value = values[operand[0]] ^ values[operand[1]] ^ ones
+            values.append(value)
+        return [values[register] for register in self.outputs]
+
+
+def truth_table_check(knowledge, query, width=16):
+    """
+    Checks if knowledge base entails query, like `model_check`, but
+    evaluates 2 ** `width` models at a time as the bits of one integer.
+
+    Within a block of models, bit m of the word for the i-th symbol is
+    bit i of m; the symbols past the first `width` are the same across
+    the block, so their words are all ones or all zeros.
+    """
+    program = Program([knowledge, query])
+    count = len(program.symbols)
+    width = min(width, count)
+    ones = (1 << (1 << width)) - 1
+
+    # Bits that alternate in runs of 2 ** i within the block
+    patterns = []
+    for i in range(width):
+        run = (1 << (1 << i)) - 1
+        period = (1 << (2 << i)) - 1
+        patterns.append((run << (1 << i)) * (ones // period))
+
+    for block in range(1 << (count - width)):
+        inputs = patterns + [
+            ones if block >> i & 1 else 0 for i in range(count - width)
+        ]
+        knowledge_true, query_true = program.run(inputs, ones)
+        if knowledge_true & (query_true ^ ones):
+            return False
+    return True
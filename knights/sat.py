@@ -0,0 +1,377 @@
+import heapq
+
+from logic import And, Biconditional, Implication, Not, Or, Symbol
+
+
+class CNF():
+    """
+    Clauses in conjunctive normal form, built from sentences with the
+    Tseitin transformation.
+
+    Variables are numbered from 1, a literal is a variable or its
+    negation, and a clause is a list of literals. Every compound
+    subsentence gets a variable of its own, constrained to equal it, so
+    the clauses grow linearly with the sentences instead of exponentially.
+    """
+
+    def __init__(self):
+        self.clauses = []
+        self.symbols = {}
+        self.literals = {}
+        self.count = 0
+
+    def variable(self):
+        """Returns a new variable."""
+        self.count += 1
+        return self.count
+
+    def add(self, sentence):
+        """
+        Adds clauses that hold exactly when sentence is true.
+
+        Conjunctions and disjunctions at the top become clauses directly,
+        without variables of their own.
+        """
+        if isinstance(sentence, And):
+            for conjunct in sentence.conjuncts:
+                self.add(conjunct)
+        elif isinstance(sentence, Or):
+            self.clauses.append([self.literal(d) for d in sentence.disjuncts])
+        elif isinstance(sentence, Implication):
+            self.clauses.append([-self.literal(sentence.antecedent),
+                                 self.literal(sentence.consequent)])
+        elif isinstance(sentence, Not) and isinstance(sentence.operand, And):
+            self.clauses.append([
+                -self.literal(c) for c in sentence.operand.conjuncts
+            ])
+        else:
+            self.clauses.append([self.literal(sentence)])
+
+    def literal(self, sentence):
+        """Returns a literal equal to sentence, adding its clauses."""
+        if isinstance(sentence, Symbol):
+            if sentence.name not in self.symbols:
+                self.symbols[sentence.name] = self.variable()
+            return self.symbols[sentence.name]
+        if isinstance(sentence, Not):
+            return -self.literal(sentence.operand)
+        if sentence in self.literals:
+            return self.literals[sentence]
+
+        if isinstance(sentence, And):
+            operands = [self.literal(c) for c in sentence.conjuncts]
+            x = self.variable()
+            for operand in operands:
+                self.clauses.append([-x, operand])
+            self.clauses.append([x] + [-operand for operand in operands])
+        elif isinstance(sentence, (Or, Implication)):
+            if isinstance(sentence, Or):
+                operands = [self.literal(d) for d in sentence.disjuncts]
+            else:
+                operands = [-self.literal(sentence.antecedent),
+                            self.literal(sentence.consequent)]
+            x = self.variable()
+            for operand in operands:
+                self.clauses.append([x, -operand])
+            self.clauses.append([-x] + operands)
+        elif isinstance(sentence, Biconditional):
+            a = self.literal(sentence.left)
+            b = self.literal(sentence.right)
+            x = self.variable()
+            self.clauses.extend([
+                [-x, -a, b], [-x, a, -b], [x, a, b], [x, -a, -b]
+            ])
+        else:
+            raise TypeError(f"cannot convert {sentence} to CNF")
+
+        self.literals[sentence] = x
+        return x
+
+
+class Solver():
+    """
+    Conflict-driven clause learning SAT solver.
+
+    Each clause watches two of its literals, and is only looked at when
+    one of them becomes false: then it either finds another literal to
+    watch, or is unit and forces its other watched literal, or is in
+    conflict. Conflicts are analyzed back to the first unique implication
+    point, the learned clause is added, and the search jumps back to the
+    level where that clause becomes unit. Decisions pick the variable
+    most active in recent conflicts, with its last value, and the search
+    restarts after a growing number of conflicts, dropping the longer
+    half of the learned clauses once there are too many.
+    """
+
+    def __init__(self, count, clauses):
+        self.count = count
+
+        # Lists indexed by literal, relying on negative indexing, so that
+        # truth[-v] and watches[-v] are those of the negation of v
+        self.truth = [None] * (2 * count + 1)
+        self.watches = [[] for _ in range(2 * count + 1)]
+
+        # Decision level and reason clause of each variable
+        self.levels = [0] * (count + 1)
+        self.reasons = [None] * (count + 1)
+        self.trail = []
+        self.trail_limits = []
+        self.head = 0
+
+        self.learned = []
+        self.capacity = max(len(clauses) // 2, 1000)
+        self.activity = [0.0] * (count + 1)
+        self.bump = 1.0
+        self.heap = [(0.0, variable) for variable in range(1, count + 1)]
+        self.phases = [False] * (count + 1)
+
+        self.unsatisfiable = False
+        for clause in clauses:
+            self.add_clause(list(dict.fromkeys(clause)))
+
+    def add_clause(self, clause):
+        """Adds a clause before solving, simplified at level 0."""
+        truth = self.truth
+        if any(-literal in clause for literal in clause):
+            return
+        if any(truth[literal] is True for literal in clause):
+            return
+        clause = [literal for literal in clause if truth[literal] is None]
+        if not clause:
+            self.unsatisfiable = True
+        elif len(clause) == 1:
+            self.assign(clause[0], None)
+            if self.propagate() is not None:
+                self.unsatisfiable = True
+        else:
+            self.watch(clause)
+
+    def watch(self, clause):
+        """Watches the first two literals of clause."""
+        self.watches[clause[0]].append(clause)
+        self.watches[clause[1]].append(clause)
+
+    def assign(self, literal, reason):
+        variable = abs(literal)
+        self.truth[literal] = True
+        self.truth[-literal] = False
+        self.levels[variable] = len(self.trail_limits)
+        self.reasons[variable] = reason
+        self.trail.append(literal)
+
+    def propagate(self):
+        """
+        Assigns every literal forced by unit clauses, and returns a clause
+        in conflict, or None.
+        """
+        truth = self.truth
+        watches = self.watches
+        trail = self.trail
+        while self.head < len(trail):
+            false = -trail[self.head]
+            self.head += 1
+            watching = watches[false]
+            kept = []
+            for i, clause in enumerate(watching):
+
+                # Keep the false literal in position 1
+                if clause[0] == false:
+                    clause[0] = clause[1]
+                    clause[1] = false
+                first = clause[0]
+                if truth[first] is True:
+                    kept.append(clause)
+                    continue
+
+                for j in range(2, len(clause)):
+                    literal = clause[j]
+                    if truth[literal] is not False:
+                        clause[1] = literal
+                        clause[j] = false
+                        watches[literal].append(clause)
+                        break
+                else:
+                    kept.append(clause)
+                    if truth[first] is False:
+                        kept.extend(watching[i + 1:])
+                        watches[false] = kept
+                        return clause
+                    self.assign(first, clause)
+            watches[false] = kept
+        return None
+
+    def analyze(self, conflict):
+        """
+        Returns the clause learned from a conflict, with the literal
+        that will become unit first, and the level to jump back to.
+        """
+        levels = self.levels
+        level = len(self.trail_limits)
+        seen = set()
+        learned = [None]
+        pending = 0
+        literal = None
+        index = len(self.trail)
+        reason = conflict
+        while True:
+            for other in reason:
+                if other == literal:
+                    continue
+                variable = abs(other)
+                if variable in seen or levels[variable] == 0:
+                    continue
+                seen.add(variable)
+                self.increase(variable)
+                if levels[variable] == level:
+                    pending += 1
+                else:
+                    learned.append(other)
+
+            # Walk back to the next literal of this level in the conflict
+            index -= 1
+            while abs(self.trail[index]) not in seen:
+                index -= 1
+            literal = self.trail[index]
+            pending -= 1
+            if pending == 0:
+                break
+            reason = self.reasons[abs(literal)]
+        learned[0] = -literal
+        self.bump /= 0.95
+
+        # Drop literals whose reason only has literals already learned
+        variables = {abs(other) for other in learned}
+        minimal = [learned[0]]
+        for other in learned[1:]:
+            reason = self.reasons[abs(other)]
+            if reason is None or any(
+                abs(r) not in variables and levels[abs(r)] > 0
+                for r in reason if r != -other
+            ):
+                minimal.append(other)
+        learned = minimal
+
+        if len(learned) == 1:
+            return learned, 0
+
+        # Watch the literal from the highest remaining level second
+        highest = max(range(1, len(learned)),
+                      key=lambda i: levels[abs(learned[i])])
+        learned[1], learned[highest] = learned[highest], learned[1]
+        return learned, levels[abs(learned[1])]
+
+    def increase(self, variable):
+        """Bumps the activity of variable after a conflict."""
+        self.activity[variable] += self.bump
+        if self.activity[variable] > 1e100:
+            self.activity = [a * 1e-100 for a in self.activity]
+            self.bump *= 1e-100
+            self.heap = [(-self.activity[v], v)
+                         for v in range(1, self.count + 1)
+                         if self.truth[v] is None]
+            heapq.heapify(self.heap)
+        elif self.truth[variable] is None:
+            heapq.heappush(self.heap, (-self.activity[variable], variable))
+
+    def backjump(self, level):
+        """Undoes every assignment above decision level `level`."""
+        if len(self.trail_limits) <= level:
+            return
+        start = self.trail_limits[level]
+        for literal in self.trail[start:]:
+            variable = abs(literal)
+            self.phases[variable] = literal > 0
+            self.truth[literal] = None
+            self.truth[-literal] = None
+            self.reasons[variable] = None
+            heapq.heappush(self.heap, (-self.activity[variable], variable))
+        del self.trail[start:]
+        del self.trail_limits[level:]
+        self.head = start
+
+    def decide(self):
+        """Returns the next decision literal, or None if all are set."""
+        while self.heap:
+            activity, variable = heapq.heappop(self.heap)
+            if (self.truth[variable] is None
+                    and -activity == self.activity[variable]):
+                return variable if self.phases[variable] else -variable
+        return None
+
+    def reduce(self):
+        """Forgets the longer half of the learned clauses, at level 0."""
+        self.learned.sort(key=len)
+        keep = len(self.learned) // 2
+        forgotten = {id(clause) for clause in self.learned[keep:]
+                     if len(clause) > 2}
+        self.learned = [clause for clause in self.learned
+                        if id(clause) not in forgotten]
+        for literal in range(-self.count, self.count + 1):
+            self.watches[literal] = [
+                clause for clause in self.watches[literal]
+                if id(clause) not in forgotten
+            ]
+
+    def solve(self):
+        """
+        Returns a satisfying assignment as a list indexed by variable, or
+        None if the clauses are unsatisfiable.
+        """
+        if self.unsatisfiable:
+            return None
+        conflicts = 0
+        limit = 100
+        while True:
+            conflict = self.propagate()
+            if conflict is not None:
+                if not self.trail_limits:
+                    return None
+                conflicts += 1
+                learned, level = self.analyze(conflict)
+                self.backjump(level)
+                if len(learned) == 1:
+                    self.assign(learned[0], None)
+                else:
+                    self.watch(learned)
+                    self.learned.append(learned)
+                    self.assign(learned[0], learned)
+                continue
+
+            if conflicts >= limit:
+                conflicts = 0
+                limit = int(limit * 1.5)
+                self.backjump(0)
+                if len(self.learned) > self.capacity:
+                    self.reduce()
+                    self.capacity = int(self.capacity * 1.1)
+                continue
+
+            literal = self.decide()
+            if literal is None:
+                return self.truth[:self.count + 1]
+            self.trail_limits.append(len(self.trail))
+            self.assign(literal, None)
+
+
+def satisfiable(sentence):
+    """
+    Returns a model of sentence as a dictionary mapping symbol names to
+    values, or None if it is unsatisfiable.
+    """
+    cnf = CNF()
+    cnf.add(sentence)
+    values = Solver(cnf.count, cnf.clauses).solve()
+    if values is None:
+        return None
+    return {
+        name: bool(values[variable])
+        for name, variable in cnf.symbols.items()
+    }
+
+
+def entails(knowledge, query):
+    """
+    Checks if knowledge base entails query, like `logic.model_check`, by
+    checking that knowledge and not query cannot both be true.
+    """
+    return satisfiable(And(knowledge, Not(query))) is None
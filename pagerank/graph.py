@@ -0,0 +1,479 @@
+import multiprocessing
+from array import array
+
+import numpy as np
+import scipy.sparse
+
+# Graph shared by the processes of `parallel_random_walk`
+worker_graph = None
+
+# Solvers accepted by `power_iteration`
+SOLVERS = ("power", "gauss-seidel", "aitken", "quadratic", "adaptive")
+
+# Number of power iterations between extrapolation steps
+EXTRAPOLATION_PERIOD = 10
+
+
+class Graph():
+    """
+    Link graph of a corpus, stored as sparse arrays for fast power iteration.
+
+    Pages are numbered 0 to n - 1 in `pages` order. The link `matrix` is
+    a SciPy CSR matrix whose entry (i, j) is 1 / (number of links on page
+    j) if page j links to page i, so row `i` holds the in-links of page
+    `i` and one PageRank iteration is one sparse matrix product.
+
+    The same links sorted by the page they come from are kept in
+    `out_targets`, with page `i` linking to
+    `out_targets[out_starts[i]:out_starts[i + 1]]`.
+
+    Pages without links are `dangling`, and are treated as linking to
+    every page in the corpus, including themselves.
+    """
+
+    def __init__(self, pages, sources, targets):
+        self.pages = list(pages)
+        self.index = {page: i for i, page in enumerate(self.pages)}
+        self.n = len(self.pages)
+
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        self.out_degree = np.bincount(sources, minlength=self.n)
+        self.dangling = self.out_degree == 0
+        self.out_starts = np.concatenate(([0], np.cumsum(self.out_degree)))
+        self.out_targets = targets[np.argsort(sources, kind="stable")]
+
+        self.matrix = scipy.sparse.csr_matrix(
+            (1 / self.out_degree[sources], (targets, sources)),
+            shape=(self.n, self.n)
+        )
+
+    @classmethod
+    def from_corpus(cls, corpus):
+        """
+        Build a graph from a `crawl` dictionary mapping each page to the
+        set of pages it links to.
+        """
+        pages = list(corpus)
+        index = {page: i for i, page in enumerate(pages)}
+        sources = []
+        targets = []
+        for page in pages:
+            for link in corpus[page]:
+                sources.append(index[page])
+                targets.append(index[link])
+        return cls(pages, sources, targets)
+
+    @classmethod
+    def from_edge_list(cls, filename):
+        """
+        Build a graph from an edge list written by `crawl_edges`, reading
+        it one line at a time.
+        """
+        index = {}
+        sources = array("q")
+        targets = array("q")
+        with open(filename, encoding="utf-8") as f:
+            for line in f:
+                fields = line.rstrip("\n").split("\t")
+                for page in fields:
+                    if page not in index:
+                        index[page] = len(index)
+                if len(fields) == 2:
+                    sources.append(index[fields[0]])
+                    targets.append(index[fields[1]])
+        return cls(index, np.frombuffer(sources, dtype=np.int64),
+                   np.frombuffer(targets, dtype=np.int64))
+
+    def propagate(self, rank):
+        """
+        Returns, for each page, the sum of rank / links over the pages
+        linking to it: one sparse matrix product with the link matrix.
+
+        `rank` may be a vector, or a matrix with one column per rank vector.
+        """
+        return self.matrix @ rank
+
+    def step(self, rank, damping, teleport=None):
+        """
+        Returns the rank vector after one PageRank iteration from `rank`.
+
+        The surfer jumps to (and leaves dangling pages for) a page drawn
+        from `teleport`, or from all pages uniformly if it is None. With
+        a matrix of ranks, `teleport` has one distribution per column.
+        """
+        dangling = rank[self.dangling].sum(axis=0)
+        if teleport is None:
+            return (
+                (1 - damping) / self.n
+                + damping * (self.propagate(rank) + dangling / self.n)
+            )
+        return (
+            (1 - damping) * teleport
+            + damping * (self.propagate(rank) + dangling * teleport)
+        )
+
+    def ranks(self, rank):
+        """
+        Returns a rank vector as a dictionary mapping pages to floats.
+        """
+        return dict(zip(self.pages, rank.tolist()))
+
+
+def power_iteration(graph, damping, tolerance=0.001, max_iterations=1000,
+                    start=None, teleport=None, solver="power"):
+    """
+    Iterate PageRank on `graph` until no page's rank changes by more than
+    `tolerance`, or `max_iterations` iterations have run, starting from
+    rank vector `start`, or from the uniform distribution if not given.
+
+    If `teleport` is an n x k matrix whose columns are distributions over
+    pages, all k personalized rank vectors are computed together, sharing
+    each pass over the link matrix, and the result is an n x k matrix.
+
+    `solver` is one of `SOLVERS`:
+      "power"         plain power iteration
+      "gauss-seidel"  updates blocks of pages in place, so later blocks
+                      already see this sweep's ranks for earlier ones
+      "aitken"        power iteration, extrapolating componentwise from
+                      the last 3 iterates every `EXTRAPOLATION_PERIOD`
+      "quadratic"     the same, fitting the last 4 iterates instead
+      "adaptive"      stops recomputing pages once they have converged,
+                      at the cost of a slightly looser result
+
+    Returns a (rank, residuals) tuple, where `rank` is the final rank
+    vector and `residuals` lists the largest change at each iteration.
+    """
+    if solver not in SOLVERS:
+        raise ValueError(f"unknown solver: {solver}")
+    if teleport is not None:
+        teleport = np.asarray(teleport, dtype=float)
+        teleport = teleport / teleport.sum(axis=0)
+    if start is not None:
+        rank = np.asarray(start, dtype=float) / np.sum(start, axis=0)
+    elif teleport is not None:
+        rank = teleport.copy()
+    else:
+        rank = np.full(graph.n, 1 / graph.n)
+
+    if solver == "gauss-seidel":
+        return gauss_seidel(graph, damping, tolerance, max_iterations,
+                            rank, teleport)
+    if solver == "adaptive":
+        return adaptive_iteration(graph, damping, tolerance, max_iterations,
+                                  rank, teleport)
+
+    extrapolate = {"aitken": aitken, "quadratic": quadratic}.get(solver)
+    iterates = []
+    residuals = []
+    for iteration in range(max_iterations):
+        new_rank = graph.step(rank, damping, teleport)
+        new_rank /= new_rank.sum(axis=0)
+        residuals.append(float(np.abs(new_rank - rank).max()))
+        rank = new_rank
+        if residuals[-1] < tolerance:
+            break
+
+        if extrapolate is not None:
+            iterates = iterates[-3:] + [rank]
+            if (iteration + 1) % EXTRAPOLATION_PERIOD == 0:
+                rank = extrapolate(iterates)
+    return rank, residuals
+
+
+def gauss_seidel(graph, damping, tolerance, max_iterations, rank, teleport,
+                 blocks=256):
+    """
+    Block Gauss-Seidel iteration for `power_iteration`: each sweep updates
+    the pages in up to `blocks` ranges, one sparse product per range,
+    using the ranks already updated in this sweep for the earlier ranges.
+    Small corpora get one page per range, which is plain Gauss-Seidel.
+
+    Gauss-Seidel only gains on links to pages updated earlier in a sweep,
+    so sweeps alternate between forward and backward page order.
+    """
+    jump = teleport if teleport is not None else np.full(graph.n, 1 / graph.n)
+    block_size = max(1, -(-graph.n // blocks))
+    ranges = [
+        (start, stop, graph.matrix[start:stop], graph.dangling[start:stop])
+        for start, stop in (
+            (start, min(start + block_size, graph.n))
+            for start in range(0, graph.n, block_size)
+        )
+    ]
+    residuals = []
+    for _ in range(max_iterations):
+        dangling = rank[graph.dangling].sum(axis=0)
+        residual = 0
+        for start, stop, rows, sinks in ranges:
+            new_rank = (
+                (1 - damping) * jump[start:stop]
+                + damping * (rows @ rank + dangling * jump[start:stop])
+            )
+            change = new_rank - rank[start:stop]
+            dangling = dangling + change[sinks].sum(axis=0)
+            residual = max(residual, float(np.abs(change).max()))
+            rank[start:stop] = new_rank
+        rank /= rank.sum(axis=0)
+        ranges.reverse()
+        residuals.append(residual)
+        if residual < tolerance:
+            break
+    return rank, residuals
+
+
+def adaptive_iteration(graph, damping, tolerance, max_iterations, rank,
+                       teleport):
+    """
+    Adaptive power iteration for `power_iteration`: a page whose rank
+    changes by less than `tolerance` * (1 - damping) / 10 is frozen, and
+    its row of the link matrix is no longer multiplied.
+
+    Dropping rows means copying the rest of the matrix, so the rows are
+    only dropped once at least a quarter of those left have converged.
+    Once the pages left have converged, one full iteration updates the
+    frozen pages too, and iteration only stops if no page moved by
+    `tolerance` in it, so the result passes the same test as "power".
+    """
+    jump = teleport if teleport is not None else np.full(graph.n, 1 / graph.n)
+    everyone = np.arange(graph.n)
+    active = everyone
+    rows = graph.matrix
+    residuals = []
+    for _ in range(max_iterations):
+        dangling = rank[graph.dangling].sum(axis=0)
+        new_rank = (
+            (1 - damping) * jump[active]
+            + damping * (rows @ rank + dangling * jump[active])
+        )
+        change = np.abs(new_rank - rank[active])
+        if change.ndim == 2:
+            change = change.max(axis=1)
+        rank[active] = new_rank
+        residuals.append(float(change.max()) if len(change) else 0.0)
+
+        if residuals[-1] < tolerance:
+            if len(active) == graph.n:
+                break
+            active = everyone
+            rows = graph.matrix
+            continue
+
+        moving = change >= tolerance * (1 - damping) / 10
+        if moving.sum() < len(active) * 0.75:
+            active = active[moving]
+            rows = rows[moving]
+    return rank / rank.sum(axis=0), residuals
+
+
+def aitken(iterates):
+    """
+    Aitken delta-squared extrapolation of each page's rank from the last
+    3 iterates, keeping the latest rank where the estimate is unusable.
+    """
+    x0, x1, x2 = iterates[-3:]
+    first = x1 - x0
+    second = x2 - 2 * x1 + x0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rank = x0 - first ** 2 / second
+    unusable = ~np.isfinite(rank) | (rank < 0) | (np.abs(second) < 1e-15)
+    rank[unusable] = x2[unusable]
+    return rank / rank.sum(axis=0)
+
+
+def quadratic(iterates):
+    """
+    Quadratic extrapolation (Kamvar et al.) from the last 4 iterates,
+    which assumes the error lies mostly along the two eigenvectors with
+    the next largest eigenvalues and removes those components.
+    """
+    if iterates[-1].ndim == 2:
+        columns = [
+            quadratic([x[:, j] for x in iterates])
+            for j in range(iterates[-1].shape[1])
+        ]
+        return np.column_stack(columns)
+
+    x0, x1, x2, x3 = iterates[-4:]
+    differences = np.column_stack((x1 - x0, x2 - x0))
+    gamma = np.linalg.lstsq(differences, x0 - x3, rcond=None)[0]
+    gamma1, gamma2, gamma3 = gamma[0], gamma[1], 1.0
+    rank = ((gamma1 + gamma2 + gamma3) * x1 + (gamma2 + gamma3) * x2
+            + gamma3 * x3)
+    if not np.all(np.isfinite(rank)) or rank.sum() <= 0:
+        return x3
+    rank = np.maximum(rank, 0)
+    return rank / rank.sum()
+
+
+def push_pagerank(graph, damping, teleport, epsilon=1e-6):
+    """
+    Approximate personalized PageRank on `graph` by pushing probability
+    mass out from the pages in `teleport`, a dictionary mapping a few
+    page numbers to their teleport weights.
+
+    Each page holds a residual of mass not yet settled. Pushing a page
+    settles (1 - damping) of its residual as rank and spreads the rest
+    over its links (or back over `teleport`, for dangling pages), and
+    continues until every residual is below `epsilon` per link. The work
+    depends on the pages near the seeds, not on the size of the corpus.
+
+    Returns a dictionary mapping page numbers to approximate ranks, which
+    sum to slightly less than 1 by the mass left in residuals.
+    """
+    total = sum(teleport.values())
+    teleport = {page: weight / total for page, weight in teleport.items()}
+    starts = graph.out_starts.tolist()
+    targets = graph.out_targets.tolist()
+    rank = {}
+    residual = dict(teleport)
+    queue = list(residual)
+    while queue:
+        page = queue.pop()
+        links = starts[page + 1] - starts[page]
+        mass = residual.get(page, 0)
+        if mass < epsilon * max(links, 1):
+            continue
+        residual[page] = 0
+        rank[page] = rank.get(page, 0) + (1 - damping) * mass
+
+        if links:
+            share = damping * mass / links
+            spread = ((target, share)
+                      for target in targets[starts[page]:starts[page + 1]])
+        else:
+            spread = ((target, damping * mass * weight)
+                      for target, weight in teleport.items())
+        for target, share in spread:
+            before = residual.get(target, 0)
+            residual[target] = before + share
+            threshold = epsilon * max(starts[target + 1] - starts[target], 1)
+            if before < threshold <= residual[target]:
+                queue.append(target)
+    return rank
+
+
+def random_walk(graph, damping, n, rng=None, steps_per_walker=1000):
+    """
+    Return an array of how often each page is visited in `n` steps of
+    random surfing on `graph`.
+
+    Each step flips a damping coin and then picks either one of the
+    current page's links or any page, both uniformly, so a step costs
+    O(1) instead of building a distribution over the whole corpus.
+
+    The steps are split between independent surfers, each taking about
+    `steps_per_walker` steps, and all surfers are moved at once with
+    vectorized NumPy draws. Each surfer starts from a page chosen at
+    random and takes a few uncounted steps first, until the chance that
+    it has not yet followed the damping coin off its start page is
+    negligible.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    walkers = max(1, min(n, n // steps_per_walker))
+    steps = -(-n // walkers)
+    counts = np.zeros(graph.n, dtype=np.int64)
+    burn_in = int(np.log(1e-4) / np.log(damping)) if 0 < damping < 1 else 0
+
+    # Record visits in blocks, to count them with one bincount per block
+    block = max(1, (1 << 20) // walkers)
+    visits = np.empty((block, walkers), dtype=np.int64)
+    recorded = 0
+
+    page = rng.integers(graph.n, size=walkers)
+    for step in range(-burn_in, steps):
+        links = graph.out_degree[page]
+        follow = (rng.random(walkers) < damping) & (links > 0)
+        jump = rng.integers(graph.n, size=walkers)
+        if follow.any():
+            pick = (rng.random(walkers) * links).astype(np.int64)
+            link = graph.out_starts[page] + pick
+            jump[follow] = graph.out_targets[link[follow]]
+        page = jump
+        if step < 0:
+            continue
+
+        visits[step % block] = page
+        if step % block == block - 1 or step == steps - 1:
+            taken = visits[:step % block + 1].ravel()[:n - recorded]
+            counts += np.bincount(taken, minlength=graph.n)
+            recorded += len(taken)
+    return counts
+
+
+def parallel_random_walk(graph, damping, n, processes=None, seed=None,
+                         tolerance=None, batch_steps=250000, z=1.96):
+    """
+    Estimate PageRank on `graph` from up to `n` random surfing steps,
+    run as independent batches of at most `batch_steps` across a process
+    pool. The batches are sized so that every round gives each process
+    one, and so that there are at least two to compare.
+
+    Every batch has its own seeded generator, spawned from `seed`, so
+    results are reproducible for a given seed and number of batches.
+    The batch estimates are merged into their mean, weighted by batch
+    size, with a confidence interval of `z` standard errors for each page.
+
+    If `tolerance` is given, sampling stops early once every interval
+    is narrower than `tolerance` on each side.
+
+    Returns a (rank, half_widths, steps) tuple of the estimated rank
+    vector, the interval half-width of each page and the steps taken.
+    """
+    processes = processes or multiprocessing.cpu_count()
+    rounds = -(-n // (processes * batch_steps))
+    batch_steps = max(1, -(-n // max(processes * rounds, 2)))
+    seeds = np.random.SeedSequence(seed)
+
+    # Size-weighted sums of the batch frequencies and of their squares
+    total = np.zeros(graph.n)
+    squares = np.zeros(graph.n)
+    weight = 0
+    batches = 0
+    steps = 0
+    half_widths = np.full(graph.n, np.inf)
+
+    with multiprocessing.Pool(processes, initializer=init_worker,
+                              initargs=(graph,)) as pool:
+        while steps < n:
+
+            # Hand out one round of batches, one per process
+            tasks = []
+            while len(tasks) < processes and steps < n:
+                size = min(batch_steps, n - steps)
+                tasks.append((damping, size, seeds.spawn(1)[0]))
+                steps += size
+
+            for size, frequency in pool.imap(walk_batch, tasks):
+                total += size * frequency
+                squares += size * frequency ** 2
+                weight += size
+                batches += 1
+
+            # A batch of `size` steps has variance of about sigma^2 / size,
+            # so the weighted mean has variance sigma^2 / weight
+            if batches > 1:
+                mean = total / weight
+                sigma2 = np.maximum(squares - weight * mean ** 2, 0)
+                sigma2 /= batches - 1
+                half_widths = z * np.sqrt(sigma2 / weight)
+                if tolerance is not None and half_widths.max() < tolerance:
+                    break
+
+    return total / weight, half_widths, steps
+
+
+def init_worker(graph):
+    global worker_graph
+    worker_graph = graph
+
+
+def walk_batch(task):
+    """
+    Run one batch of `parallel_random_walk` in a worker process, and
+    return its size and the visit frequency of each page.
+    """
+    damping, size, seed = task
+    counts = random_walk(worker_graph, damping, size, np.random.default_rng(seed))
+    return size, counts / size
@@ -1,23 +1,78 @@
+import argparse
+import json
+import multiprocessing
 import os
-import random
 import re
-import sys
+
+import numpy as np
+
+from graph import (SOLVERS, Graph, parallel_random_walk, power_iteration,
+                   push_pagerank, random_walk)
 
 DAMPING = 0.85
 SAMPLES = 10000
 
+# Links to other pages in an HTML file
+LINK = re.compile(r"<a\s+(?:[^>]*?)href=\"([^\"]*)\"")
+
 
 def main():
-    if len(sys.argv) != 2:
-        sys.exit("Usage: python pagerank.py corpus")
-    corpus = crawl(sys.argv[1])
+    parser = argparse.ArgumentParser(
+        usage="python pagerank.py [--edges FILE [--processes N]] "
+              "[--state FILE] [--solver NAME] [--tolerance T] corpus"
+    )
+    parser.add_argument("corpus")
+    parser.add_argument("--edges", metavar="FILE",
+                        help="crawl in parallel to an edge list in FILE")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="number of crawler processes")
+    parser.add_argument("--state", metavar="FILE",
+                        help="update ranks incrementally from state in FILE")
+    parser.add_argument("--solver", choices=SOLVERS, default="power",
+                        help="iteration method (default: power)")
+    parser.add_argument("--tolerance", type=float, default=0.001,
+                        help="largest change per page at convergence")
+    args = parser.parse_args()
+
+    if args.state is not None:
+        ranks, changes, iterations = incremental_pagerank(
+            args.corpus, args.state, DAMPING, args.tolerance,
+            solver=args.solver
+        )
+        print(f"{len(changes['added'])} added, {len(changes['removed'])} "
+              f"removed, {len(changes['changed'])} changed pages")
+        print(f"PageRank Results from Iteration ({iterations} iterations)")
+        for page in sorted(ranks):
+            print(f"  {page}: {ranks[page]:.4f}")
+        return
+
+    if args.edges is not None:
+        crawl_edges(args.corpus, args.edges, args.processes)
+        graph = Graph.from_edge_list(args.edges)
+        ranks = graph.ranks(random_walk(graph, DAMPING, SAMPLES) / SAMPLES)
+        print(f"PageRank Results from Sampling (n = {SAMPLES})")
+        for page in sorted(ranks):
+            print(f"  {page}: {ranks[page]:.4f}")
+        rank, residuals = power_iteration(graph, DAMPING, args.tolerance,
+                                          solver=args.solver)
+        ranks = graph.ranks(rank)
+        print(f"PageRank Results from Iteration ({args.solver}, "
+              f"{len(residuals)} iterations, residual {residuals[-1]:.2e})")
+        for page in sorted(ranks):
+            print(f"  {page}: {ranks[page]:.4f}")
+        return
+
+    corpus = crawl(args.corpus)
 
     ranks = sample_pagerank(corpus, DAMPING, SAMPLES)
     print(f"PageRank Results from Sampling (n = {SAMPLES})")
     for page in sorted(ranks):
         print(f"  {page}: {ranks[page]:.4f}")
-    ranks = iterate_pagerank(corpus, DAMPING)
-    print(f"PageRank Results from Iteration")
+    residuals = []
+    ranks = iterate_pagerank(corpus, DAMPING, args.tolerance,
+                             solver=args.solver, residuals=residuals)
+    print(f"PageRank Results from Iteration ({args.solver}, "
+          f"{len(residuals)} iterations, residual {residuals[-1]:.2e})")
     for page in sorted(ranks):
         print(f"  {page}: {ranks[page]:.4f}")
 
@@ -29,26 +84,205 @@ def crawl(directory):
     a list of all other pages in the corpus that are linked to by the page.
     """
     pages = dict()
+    filenames = html_files(directory)
 
-    # Extract all links from HTML files
-    for filename in os.listdir(directory):
-        if not filename.endswith(".html"):
-            continue
-        with open(os.path.join(directory, filename)) as f:
-            contents = f.read()
-            links = re.findall(r"<a\s+(?:[^>]*?)href=\"([^\"]*)\"", contents)
-            pages[filename] = set(links) - {filename}
-
-    # Only include links to other pages in the corpus
-    for filename in pages:
+    # Extract links to other pages in the corpus from each HTML file
+    for filename in filenames:
+        links = extract_links(os.path.join(directory, filename))
         pages[filename] = set(
-            link for link in pages[filename]
-            if link in pages
+            link for link in links
+            if link in filenames and link != filename
         )
 
     return pages
 
 
+def crawl_edges(directory, filename, processes=None):
+    """
+    Parse a directory of HTML pages across a pool of `processes` processes
+    and write the links between them to `filename` as an edge list.
+
+    Each page gets a line with its name, followed by one line per link,
+    with the page and the page it links to separated by a tab. Lines are
+    written as pages are parsed, so the corpus is never held in memory.
+    """
+    filenames = html_files(directory)
+    paths = (os.path.join(directory, page) for page in filenames)
+    with open(filename, "w", encoding="utf-8") as f, \
+            multiprocessing.Pool(processes) as pool:
+        for path, links in pool.imap_unordered(
+            path_links, paths, chunksize=64
+        ):
+            page = os.path.basename(path)
+            f.write(f"{page}\n")
+            for link in sorted(links):
+                if link in filenames and link != page:
+                    f.write(f"{page}\t{link}\n")
+
+
+def html_files(directory):
+    """
+    Return the set of HTML file names in `directory`.
+    """
+    return set(
+        entry.name for entry in os.scandir(directory)
+        if entry.name.endswith(".html")
+    )
+
+
+def extract_links(path, chunk_size=1 << 16):
+    """
+    Return the set of pages linked to by the HTML file at `path`,
+    reading it in chunks of `chunk_size` characters.
+    """
+    links = set()
+    carry = ""
+    with open(path) as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            contents = carry + chunk
+            end = 0
+            for match in LINK.finditer(contents):
+                links.add(match.group(1))
+                end = match.end()
+
+            # Keep any tag that may continue into the next chunk
+            start = contents.rfind("<", end)
+            carry = contents[start:] if start >= 0 else ""
+    return links
+
+
+def path_links(path):
+    return path, extract_links(path)
+
+
+def personalized_pagerank(corpus, damping_factor, seed_sets, tolerance=0.001,
+                          max_iterations=1000, approximate=False,
+                          epsilon=1e-6):
+    """
+    Return topic-specific PageRank values for each set of seed pages in
+    `seed_sets`, where the random surfer only ever jumps to a page in the
+    seed set (chosen uniformly) instead of to any page in the corpus.
+
+    Return a list with one dictionary per seed set, mapping pages to
+    their PageRank values, which sum to 1.
+
+    All seed sets are ranked together by one batched power iteration over
+    a single link matrix. If `approximate` is true, each seed set is
+    instead ranked by pushing mass out from its pages until what is left
+    is below `epsilon` per link, which is much faster for small seed sets
+    in large corpora; pages never reached are left out of the dictionary.
+    """
+    graph = Graph.from_corpus(corpus)
+    if approximate:
+        results = []
+        for seeds in seed_sets:
+            teleport = {graph.index[page]: 1 for page in seeds}
+            rank = push_pagerank(graph, damping_factor, teleport, epsilon)
+            total = sum(rank.values())
+            results.append({
+                graph.pages[page]: value / total for page, value in rank.items()
+            })
+        return results
+
+    teleport = np.zeros((graph.n, len(seed_sets)))
+    for column, seeds in enumerate(seed_sets):
+        for page in seeds:
+            teleport[graph.index[page], column] = 1
+    rank, residuals = power_iteration(
+        graph, damping_factor, tolerance, max_iterations, teleport=teleport
+    )
+    return [graph.ranks(rank[:, column]) for column in range(len(seed_sets))]
+
+
+def incremental_pagerank(directory, state, damping_factor, tolerance=0.001,
+                         max_iterations=1000, solver="power"):
+    """
+    Return PageRank values for the corpus in `directory`, reusing the
+    links and ranks saved in file `state` by the previous call.
+
+    Only HTML files whose size or modification time changed are parsed
+    again, and iteration starts from the previous ranks, so small edits
+    to a corpus converge in a few iterations. The new links and ranks
+    are saved back to `state`.
+
+    Return a (ranks, changes, iterations) tuple, where `changes` maps
+    "added", "removed" and "changed" to sorted lists of pages.
+    """
+    previous = load_state(state) if os.path.exists(state) else {}
+
+    # Re-parse only files that are new or were modified
+    filenames = html_files(directory)
+    files = {}
+    changes = {"added": [], "removed": [], "changed": []}
+    for filename in filenames:
+        stat = os.stat(os.path.join(directory, filename))
+        stamp = (stat.st_size, stat.st_mtime_ns)
+        if filename in previous and previous[filename]["stamp"] == stamp:
+            files[filename] = previous[filename]
+            continue
+        links = extract_links(os.path.join(directory, filename))
+        links = sorted(links - {filename})
+        rank = None
+        if filename not in previous:
+            changes["added"].append(filename)
+        else:
+            rank = previous[filename]["rank"]
+            if links != previous[filename]["links"]:
+                changes["changed"].append(filename)
+        files[filename] = {"stamp": stamp, "links": links, "rank": rank}
+    changes["removed"] = sorted(set(previous) - filenames)
+    changes["added"].sort()
+    changes["changed"].sort()
+
+    corpus = {
+        filename: set(link for link in files[filename]["links"]
+                      if link in filenames)
+        for filename in filenames
+    }
+    graph = Graph.from_corpus(corpus)
+
+    # Warm start from the previous ranks, giving new pages an even share
+    start = None
+    if previous:
+        start = [files[page]["rank"] for page in graph.pages]
+        start = [1 / graph.n if rank is None else rank for rank in start]
+    rank, residuals = power_iteration(
+        graph, damping_factor, tolerance, max_iterations, start, solver=solver
+    )
+
+    for page, value in zip(graph.pages, rank.tolist()):
+        files[page]["rank"] = value
+    save_state(state, files)
+    return graph.ranks(rank), changes, len(residuals)
+
+
+def load_state(filename):
+    """
+    Load the per-page size and modification time, links and rank
+    saved by `save_state`.
+    """
+    with open(filename, encoding="utf-8") as f:
+        return {
+            page: {"stamp": tuple(value["stamp"]), "links": value["links"],
+                   "rank": value["rank"]}
+            for page, value in json.load(f).items()
+        }
+
+
+def save_state(filename, files):
+    """
+    Save the per-page size and modification time, links and rank
+    for `incremental_pagerank`.
+    """
+    temporary = f"{filename}.tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        json.dump(files, f)
+    os.replace(temporary, filename)
+
+
 def transition_model(corpus, page, damping_factor):
     """
     Return a probability distribution over which page to visit next,
@@ -97,32 +331,44 @@ def sample_pagerank(corpus, damping_factor, n):
     Return a dictionary where keys are page names, and values are
     their estimated PageRank value (a value between 0 and 1). All
     PageRank values should sum to 1.
-    """
-    probability = dict()
-    for pag1 in corpus:
-        probability[pag1] = 0
 
-    # cs50 ai told me to use random.choices(list(corpus.keys())) but i removed the s in choices and fixed a problem i had
-    current_page = random.choice(list(corpus.keys()))
-    for i in range(n):
-        transition = transition_model(corpus, current_page, damping_factor)
-        # cs50 ai told me to use exactly weights = transition.values()
-        random_choice = random.choices(list(corpus.keys()), weights=transition.values())
-        current_page = random_choice[0]
-        probability[current_page] += 1
+    Rather than calling `transition_model` at every step, the surfers of
+    `random_walk` sample in two stages from the corpus's link arrays:
+    a damping coin, then a uniform pick among the page's links or among
+    all pages.
+    """
+    graph = Graph.from_corpus(corpus)
+    counts = random_walk(graph, damping_factor, n)
+    return graph.ranks(counts / n)
 
-    total = []
-    for pag1 in corpus:
-        total.append(probability[pag1])
 
-    summed = sum(total)
-    for pag1 in corpus:
-        probability[pag1] = probability[pag1] / summed
+def parallel_sample_pagerank(corpus, damping_factor, n, processes=None,
+                             seed=None, tolerance=None):
+    """
+    Return PageRank values for each page by sampling up to `n` pages
+    with many independent surfers spread across `processes` processes.
 
-    return probability
+    Return a (ranks, intervals) tuple, where `ranks` is as for
+    `sample_pagerank` and `intervals` maps each page to the (low, high)
+    bounds of a 95% confidence interval around its value. Sampling
+    stops early once every interval is within `tolerance` of its value.
+    """
+    graph = Graph.from_corpus(corpus)
+    rank, half_widths, steps = parallel_random_walk(
+        graph, damping_factor, n, processes, seed, tolerance
+    )
+    ranks = graph.ranks(rank)
+    intervals = {
+        page: (low, high) for page, low, high in zip(
+            graph.pages, (rank - half_widths).tolist(),
+            (rank + half_widths).tolist()
+        )
+    }
+    return ranks, intervals
 
 
-def iterate_pagerank(corpus, damping_factor):
+def iterate_pagerank(corpus, damping_factor, tolerance=0.001, max_iterations=1000,
+                     solver="power", residuals=None):
     """
     Return PageRank values for each page by iteratively updating
     PageRank values until convergence.
@@ -130,55 +376,22 @@ def iterate_pagerank(corpus, damping_factor):
     Return a dictionary where keys are page names, and values are
     their estimated PageRank value (a value between 0 and 1). All
     PageRank values should sum to 1.
-    """
-
-    corps = len(corpus)
-    converge = True
-    page_rank = dict()
-    new_page_rank = dict()
-
-    for page1 in corpus:
-        page_rank[page1] = 1 / corps
-    while converge == True:
-        max_difference = 0
-        all_converged = True
-
-        for page in corpus:
-            formula_1 = (1 - damping_factor) / corps
-
-            formula_2 = 0
-            for linker in corpus:
-                if len(corpus[linker]) == 0:
-                    formula_2 += damping_factor * page_rank[linker] / corps
-            for linker in corpus:
-                # cs50 ai told me to use this if statement
-                if page in corpus[linker]:
-                    formula_2 += damping_factor * page_rank[linker] / len(corpus[linker])
 
-             # cs50 ai told me to place this exactly here
-            formula_3 = formula_2 + formula_1
-            new_page_rank[page] = formula_3
+    The corpus is turned into a sparse link matrix once, so each
+    iteration is a single matrix-vector product. Iteration stops when
+    no value changes by more than `tolerance`, or after `max_iterations`.
 
-        total = []
-        for pag1 in corpus:
-            total.append(new_page_rank[pag1])
-
-        summed = sum(total)
-        for pag1 in corpus:
-            new_page_rank[pag1] = new_page_rank[pag1] / summed
-
-        for page in corpus:
-            # cs50 ai told me to use the if statement and max_difference and helped me with updating max_difference
-            if abs(new_page_rank[page] - page_rank[page]) > max_difference:
-                max_difference = abs(new_page_rank[page] - page_rank[page])
-        if max_difference < 0.001:
-            all_converged = False
-
-        converge = all_converged
-        # cs50 ai told me to use to use this exact line below
-        page_rank = new_page_rank.copy()
-
-    return page_rank
+    `solver` picks one of the iteration methods in `graph.SOLVERS`. If
+    `residuals` is a list, the largest change at each iteration is
+    appended to it, so its length is the number of iterations run.
+    """
+    graph = Graph.from_corpus(corpus)
+    rank, history = power_iteration(
+        graph, damping_factor, tolerance, max_iterations, solver=solver
+    )
+    if residuals is not None:
+        residuals.extend(history)
+    return graph.ranks(rank)
 
 
 if __name__ == "__main__":